@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for, Response, stream_with_context, g
 from flask_cors import CORS
 import os
 import json
@@ -6,7 +6,10 @@ import base64
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.backends import default_backend
 import hashlib
 import hmac
@@ -18,29 +21,291 @@ import re
 import string
 import random
 import csv
+import io
+import struct
+import shutil
+import threading
+import weakref
+import time
+import atexit
+import sqlite3
+import bisect
+import itertools
+import math
+import multiprocessing
+import zlib
+import gzip
+import codecs
+import textwrap
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict, deque
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
 
 APP_NAME = "SecureVault"
 VERSION_URL = "https://raw.githubusercontent.com/MushhDev/db/main/version.txt"
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)
 CORS(app)
 
 DATA_DIR = "data"
-ENCRYPTED_DIR = "encrypted"
 USERS_FILE = f"{DATA_DIR}/users.json"
+USERS_LOG_FILE = f"{DATA_DIR}/users.jsonl"
+ITEMS_FILE = f"{DATA_DIR}/items.json"
+JOURNAL_FILE = f"{DATA_DIR}/items.journal"
+SQLITE_FILE = f"{DATA_DIR}/items.db"
+BLOB_DIR = f"{DATA_DIR}/blobs"
+VAULT_FILE = f"{DATA_DIR}/vault.json"
+VAULTS_DIR = f"{DATA_DIR}/vaults"
+SECRET_KEY_FILE = f"{DATA_DIR}/secret.key"
+STREAM_CHUNK_SIZE = 64 * 1024
+CONFIG_FILE = "config.json"
+SETTINGS_FILE = "settings.json"
 os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(ENCRYPTED_DIR, exist_ok=True)
 
-def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+def load_config(path):
+    try:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except:
+        pass
     return {}
 
-def save_users(users):
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(users, f, indent=2, ensure_ascii=False)
+# The installers rewrite config.json, so server and storage settings belong in settings.json; config.json is only a fallback.
+config = {**load_config(CONFIG_FILE), **load_config(SETTINGS_FILE)}
+STORAGE_MODE = config.get("storage_mode", "journal")
+JOURNAL_COMPACT_BYTES = int(config.get("journal_compact_bytes", 4 * 1024 * 1024))
+JOURNAL_FSYNC_INTERVAL = float(config.get("journal_fsync_interval", 0.2))
+KEY_CACHE_TTL = float(config.get("key_cache_ttl", 900))
+KEY_CACHE_SESSIONS = int(config.get("key_cache_sessions", 256))
+KEY_CACHE_ENTRIES = int(config.get("key_cache_entries", 8))
+CRYPTO_WORKERS = int(config.get("crypto_workers", os.cpu_count() or 1))
+MAX_BATCH_SIZE = int(config.get("max_batch_size", 10000))
+IMPORT_BATCH_SIZE = int(config.get("import_batch_size", 500))
+SERVER_MODE = config.get("server_mode", "dev")
+SERVER_HOST = config.get("server_host", "127.0.0.1")
+SERVER_PORT = int(config.get("server_port", 5000))
+SERVER_WORKERS = int(config.get("server_workers", os.cpu_count() or 1))
+SERVER_THREADS = int(config.get("server_threads", 4))
+AUTH_WORKERS = int(config.get("auth_workers", max(1, (os.cpu_count() or 2) // 2)))
+AUTH_QUEUE_LIMIT = int(config.get("auth_queue_limit", max(0, SERVER_THREADS - 1 - AUTH_WORKERS)))
+AUTH_RETRY_AFTER = int(config.get("auth_retry_after", 1))
+STORAGE_FORMAT = config.get("storage_format", "compact")
+STORAGE_COMPRESSION = config.get("storage_compression", "zlib")
+STORAGE_COMPRESSION_LEVEL = int(config.get("storage_compression_level", 3))
+COMPRESSION_MIN_SIZE = int(config.get("compression_min_size", 1024))
+COMPRESSION_LEVEL = int(config.get("compression_level", 6))
+BLOB_GRACE_SECONDS = float(config.get("blob_grace_seconds", 300 if SERVER_MODE == "production" else 0))
+EVENT_HISTORY = int(config.get("event_history", 1000))
+EVENT_POLL_INTERVAL = float(config.get("event_poll_interval", 1.0))
+EVENT_STREAM_SECONDS = float(config.get("event_stream_seconds", 300))
+EVENT_STREAMS = int(config.get("event_streams", max(1, SERVER_THREADS // 2)))
+EVENT_BUSY_RETRY = float(config.get("event_busy_retry", 5))
+VAULT_CACHE_SIZE = int(config.get("vault_cache_size", 64))
+VAULT_IDLE_SECONDS = float(config.get("vault_idle_seconds", 600))
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.file = None
+        self.depth = 0
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            if self.depth == 0:
+                self.file = open(self.path, "a+b")
+                if os.name == "nt":
+                    while True:
+                        try:
+                            self.file.seek(0)
+                            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            continue
+                else:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        except Exception:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.lock.release()
+            raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            if os.name == "nt":
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self.lock.release()
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def write_file_atomic(path, data, mode=0o666):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+    # The mode applies when the file is created, so a private file is never readable under its final name.
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), mode)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+SNAPSHOT_MAGIC = b"SVS"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_CODECS = {"none": 0, "zlib": 1, "zstd": 2}
+
+def encode_snapshot(items, revision=0):
+    document = {"revision": revision, "items": items}
+    if STORAGE_FORMAT == "json":
+        return json.dumps(document, indent=2, ensure_ascii=False).encode("utf-8")
+    payload = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    codec = STORAGE_COMPRESSION if STORAGE_COMPRESSION in SNAPSHOT_CODECS else "none"
+    if codec == "zstd" and zstandard is None:
+        codec = "zlib"
+    if codec == "zlib":
+        payload = zlib.compress(payload, STORAGE_COMPRESSION_LEVEL)
+    elif codec == "zstd":
+        payload = zstandard.ZstdCompressor(level=STORAGE_COMPRESSION_LEVEL).compress(payload)
+    return SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION, SNAPSHOT_CODECS[codec]]) + payload
+
+def decode_snapshot(data):
+    if data.startswith(SNAPSHOT_MAGIC):
+        if len(data) < 5:
+            raise ValueError("Datos de almacenamiento dañados")
+        version, codec = data[3], data[4]
+        if version not in (1, SNAPSHOT_VERSION):
+            raise ValueError("Versión de almacenamiento no soportada")
+        if codec == SNAPSHOT_CODECS["zstd"] and zstandard is None:
+            raise ValueError("Se necesita el paquete zstandard para leer los datos")
+        if codec not in SNAPSHOT_CODECS.values():
+            raise ValueError("Compresión de almacenamiento no soportada")
+        data = data[5:]
+        try:
+            if codec == SNAPSHOT_CODECS["zlib"]:
+                data = zlib.decompress(data)
+            elif codec == SNAPSHOT_CODECS["zstd"]:
+                data = zstandard.ZstdDecompressor().decompress(data)
+        except Exception as e:
+            raise ValueError("Datos de almacenamiento dañados") from e
+    document = json.loads(data)
+    if isinstance(document, list):
+        return document, 0
+    if not isinstance(document, dict) or not isinstance(document.get("items"), list):
+        raise ValueError("Datos de almacenamiento dañados")
+    return document["items"], document.get("revision", 0)
+
+def load_secret_key():
+    with FileLock(SECRET_KEY_FILE + ".lock"):
+        if os.path.exists(SECRET_KEY_FILE):
+            with open(SECRET_KEY_FILE, "r", encoding="utf-8") as f:
+                secret_key = f.read().strip()
+            if secret_key:
+                return secret_key
+        secret_key = secrets.token_hex(32)
+        write_file_atomic(SECRET_KEY_FILE, secret_key.encode(), mode=0o600)
+        return secret_key
+
+app.secret_key = load_secret_key()
+
+class UserDirectory:
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.users = {}
+        self.offset = 0
+        self.stamp = None
+        self.version = 0
+        self.file_lock = FileLock(path + ".lock")
+        with self.file_lock:
+            if legacy_path and not os.path.exists(path) and os.path.exists(legacy_path):
+                self.migrate(legacy_path)
+        self.refresh()
+
+    def migrate(self, legacy_path):
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            users = json.load(f)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for username, record in users.items():
+                f.write(json.dumps(dict(record, username=username), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self):
+        stamp = self.file_stamp()
+        with self.lock:
+            if stamp == self.stamp:
+                return
+            if stamp is None or stamp[1] < self.offset:
+                self.users = {}
+                self.offset = 0
+            if stamp is not None:
+                with open(self.path, "rb") as f:
+                    f.seek(self.offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        self.offset += len(line)
+                        record = json.loads(line)
+                        self.users.setdefault(record.pop("username"), record)
+            self.stamp = stamp
+            self.version += 1
+
+    def get(self, username):
+        self.refresh()
+        return self.users.get(username)
+
+    def add(self, username, record):
+        with self.file_lock, self.lock:
+            self.refresh()
+            if username in self.users:
+                return False
+            line = json.dumps(dict(record, username=username), ensure_ascii=False) + "\n"
+            with open(self.path, "ab") as f:
+                f.write(line.encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            self.refresh()
+            return True
+
+user_directory = UserDirectory(USERS_LOG_FILE, USERS_FILE)
 
 def hash_password(password):
     salt = secrets.token_hex(16)
@@ -53,6 +318,35 @@ def verify_password(stored_password, provided_password):
     pwdhash = hashlib.pbkdf2_hmac('sha256', provided_password.encode(), salt.encode(), 100000)
     return pwdhash.hex() == stored_hash
 
+class AuthPoolBusy(Exception):
+    pass
+
+class AuthHashPool:
+    def __init__(self, workers=AUTH_WORKERS, queue_limit=AUTH_QUEUE_LIMIT, server_threads=SERVER_THREADS):
+        # Every admitted call pins a server thread until its hash finishes; keep one thread free for other requests.
+        limit = max(1, min(workers + queue_limit, server_threads - 1))
+        self.executor = ThreadPoolExecutor(max_workers=min(workers, limit), thread_name_prefix="auth-hash")
+        self.slots = threading.BoundedSemaphore(limit)
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise AuthPoolBusy()
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        return future.result()
+
+auth_pool = AuthHashPool()
+
+def auth_busy_response():
+    response = jsonify({"success": False, "error": "Servidor ocupado, inténtalo de nuevo"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(AUTH_RETRY_AFTER)
+    return response
+
 def is_logged_in():
     return session.get('logged_in', False)
 
@@ -144,6 +438,15 @@ def check_updates():
         }
 
 class EncryptionManager:
+    STREAM_MAGIC = b"SVE1"
+    STREAM_HEADER = struct.Struct(">4sBI16s8s")
+    KDF_ITERATIONS = {4: 100000, 5: 200000}
+    CONTAINER_MAGIC = b"\x89SVX"
+    CONTAINER_VERSION = 1
+    CONTAINER_HEADER = struct.Struct(">4sBBBI16sQ")
+    KDF_SHA256 = 0
+    KDF_PBKDF2 = 1
+
     @staticmethod
     def derive_key(password, salt, iterations=100000):
         kdf = PBKDF2HMAC(
@@ -155,6 +458,48 @@ class EncryptionManager:
         )
         return kdf.derive(password.encode())
 
+    @staticmethod
+    def item_key(master_key, salt, purpose):
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            info=b"SecureVault " + purpose,
+            backend=default_backend()
+        )
+        return hkdf.derive(master_key)
+
+    @staticmethod
+    def encrypt_vault(data, master_key, level):
+        salt = secrets.token_bytes(16)
+        key = EncryptionManager.item_key(master_key, salt, b"aes")
+        cipher = Cipher(algorithms.AES(key), modes.CBC(salt), backend=default_backend())
+        encryptor = cipher.encryptor()
+        padded_data = data.encode() + b'\0' * (16 - len(data.encode()) % 16)
+        encrypted = encryptor.update(padded_data) + encryptor.finalize()
+        combined = salt + encrypted
+        if level == 5:
+            hmac_key = EncryptionManager.item_key(master_key, salt, b"hmac")
+            combined += hmac.new(hmac_key, encrypted, hashlib.sha256).digest()
+        return base64.b64encode(combined).decode()
+
+    @staticmethod
+    def decrypt_vault(data, master_key, level):
+        decoded = base64.b64decode(data.encode())
+        salt = decoded[:16]
+        encrypted = decoded[16:]
+        if level == 5:
+            encrypted, hmac_tag = decoded[16:-32], decoded[-32:]
+            hmac_key = EncryptionManager.item_key(master_key, salt, b"hmac")
+            expected_hmac = hmac.new(hmac_key, encrypted, hashlib.sha256).digest()
+            if not hmac.compare_digest(hmac_tag, expected_hmac):
+                raise ValueError("HMAC verification failed")
+        key = EncryptionManager.item_key(master_key, salt, b"aes")
+        cipher = Cipher(algorithms.AES(key), modes.CBC(salt), backend=default_backend())
+        decryptor = cipher.decryptor()
+        decrypted = decryptor.update(encrypted) + decryptor.finalize()
+        return decrypted.rstrip(b'\0').decode()
+
     @staticmethod
     def encrypt_level1(data, password):
         return base64.b64encode(data.encode()).decode()
@@ -277,23 +622,2141 @@ class EncryptionManager:
         }
         return methods[level](data, password)
 
+    @staticmethod
+    def read_full(src, size):
+        data = b""
+        while len(data) < size:
+            chunk = src.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    @staticmethod
+    def stream_key(password, salt, level, master_key=None):
+        if master_key is not None:
+            return EncryptionManager.item_key(master_key, salt, b"stream")
+        if level == 4:
+            return EncryptionManager.derive_key(password, salt, 100000)
+        if level == 5:
+            return EncryptionManager.derive_key(password, salt, 200000)
+        key = hashlib.sha256((password + salt.hex()).encode()).digest()
+        return key[:16] if level <= 2 else key
+
+    @staticmethod
+    def encrypt_frames(chunks, password, level, chunk_size=STREAM_CHUNK_SIZE, master_key=None):
+        if level not in range(1, 6):
+            raise ValueError("Invalid encryption level")
+        salt = secrets.token_bytes(16)
+        nonce_prefix = secrets.token_bytes(8)
+        header = EncryptionManager.STREAM_HEADER.pack(EncryptionManager.STREAM_MAGIC, level, chunk_size, salt, nonce_prefix)
+        aead = AESGCM(EncryptionManager.stream_key(password, salt, level, master_key))
+        yield header
+        
+        def seal(index, chunk, final):
+            nonce = nonce_prefix + struct.pack(">I", index)
+            sealed = aead.encrypt(nonce, chunk, header + struct.pack(">QB", index, final))
+            return struct.pack(">I", len(sealed)) + sealed
+        
+        buffer = bytearray()
+        index = 0
+        for data in chunks:
+            buffer += data
+            start = 0
+            while len(buffer) - start > chunk_size:
+                yield seal(index, bytes(buffer[start:start + chunk_size]), False)
+                start += chunk_size
+                index += 1
+            del buffer[:start]
+        yield seal(index, bytes(buffer), True)
+
+    @staticmethod
+    def encrypt_stream(src, dst, password, level, chunk_size=STREAM_CHUNK_SIZE, master_key=None):
+        chunks = iter(lambda: src.read(chunk_size), b"")
+        for data in EncryptionManager.encrypt_frames(chunks, password, level, chunk_size, master_key):
+            dst.write(data)
+        return level
+
+    @staticmethod
+    def drain(frames, dst):
+        while True:
+            try:
+                dst.write(next(frames))
+            except StopIteration as stop:
+                return stop.value
+
+    @staticmethod
+    def decrypt_frames(src, password, master_key=None):
+        header = EncryptionManager.read_full(src, EncryptionManager.STREAM_HEADER.size)
+        if len(header) < EncryptionManager.STREAM_HEADER.size:
+            raise ValueError("Invalid stream header")
+        magic, level, chunk_size, salt, nonce_prefix = EncryptionManager.STREAM_HEADER.unpack(header)
+        if magic != EncryptionManager.STREAM_MAGIC or level not in range(1, 6):
+            raise ValueError("Invalid stream header")
+        aead = AESGCM(EncryptionManager.stream_key(password, salt, level, master_key))
+        length_bytes = EncryptionManager.read_full(src, 4)
+        index = 0
+        while True:
+            if len(length_bytes) < 4:
+                raise ValueError("Truncated stream")
+            (length,) = struct.unpack(">I", length_bytes)
+            if length > chunk_size + 16:
+                raise ValueError("Invalid chunk length")
+            sealed = EncryptionManager.read_full(src, length)
+            if len(sealed) < length:
+                raise ValueError("Truncated stream")
+            length_bytes = EncryptionManager.read_full(src, 4)
+            final = not length_bytes
+            nonce = nonce_prefix + struct.pack(">I", index)
+            try:
+                chunk = aead.decrypt(nonce, sealed, header + struct.pack(">QB", index, final))
+            except InvalidTag:
+                raise ValueError("Chunk authentication failed")
+            yield chunk
+            if final:
+                return level
+            index += 1
+
+    @staticmethod
+    def decrypt_stream(src, dst, password, master_key=None):
+        return EncryptionManager.drain(EncryptionManager.decrypt_frames(src, password, master_key), dst)
+
+    @staticmethod
+    def stream_length(size, chunk_size=STREAM_CHUNK_SIZE):
+        frames = max(1, -(-size // chunk_size))
+        return EncryptionManager.STREAM_HEADER.size + size + frames * 20
+
+    @staticmethod
+    def container_key(password, salt, kdf, iterations):
+        if kdf == EncryptionManager.KDF_PBKDF2:
+            return EncryptionManager.derive_key(password, salt, iterations)
+        if kdf == EncryptionManager.KDF_SHA256:
+            return hashlib.sha256((password + salt.hex()).encode()).digest()
+        raise ValueError("Unsupported KDF")
+
+    @staticmethod
+    def container_frames(chunks, password, level, payload_length=0):
+        if level not in range(1, 6):
+            raise ValueError("Invalid encryption level")
+        salt = secrets.token_bytes(16)
+        kdf = EncryptionManager.KDF_PBKDF2 if level in EncryptionManager.KDF_ITERATIONS else EncryptionManager.KDF_SHA256
+        iterations = EncryptionManager.KDF_ITERATIONS.get(level, 0)
+        yield EncryptionManager.CONTAINER_HEADER.pack(
+            EncryptionManager.CONTAINER_MAGIC, EncryptionManager.CONTAINER_VERSION,
+            level, kdf, iterations, salt, payload_length
+        )
+        key = EncryptionManager.container_key(password, salt, kdf, iterations)
+        yield from EncryptionManager.encrypt_frames(chunks, password, level, master_key=key)
+
+    @staticmethod
+    def write_container(src, dst, password, level, payload_length=0):
+        chunks = iter(lambda: src.read(STREAM_CHUNK_SIZE), b"")
+        for data in EncryptionManager.container_frames(chunks, password, level, payload_length):
+            dst.write(data)
+        return level
+
+    @staticmethod
+    def container_chunks(src, password):
+        header = EncryptionManager.read_full(src, EncryptionManager.CONTAINER_HEADER.size)
+        if len(header) < EncryptionManager.CONTAINER_HEADER.size:
+            raise ValueError("Invalid container header")
+        magic, version, level, kdf, iterations, salt, payload_length = EncryptionManager.CONTAINER_HEADER.unpack(header)
+        if magic != EncryptionManager.CONTAINER_MAGIC or version != EncryptionManager.CONTAINER_VERSION:
+            raise ValueError("Invalid container header")
+        # The header is not authenticated, so only the KDF the writer uses for this level is accepted; a forged
+        # iteration count would otherwise make the import run PBKDF2 for as long as the file asks.
+        expected_kdf = EncryptionManager.KDF_PBKDF2 if level in EncryptionManager.KDF_ITERATIONS else EncryptionManager.KDF_SHA256
+        if level not in range(1, 6) or kdf != expected_kdf or iterations != EncryptionManager.KDF_ITERATIONS.get(level, 0):
+            raise ValueError("Invalid container header")
+        key = EncryptionManager.container_key(password, salt, kdf, iterations)
+        yield from EncryptionManager.decrypt_frames(src, password, master_key=key)
+        return level
+
+    @staticmethod
+    def read_container(src, dst, password):
+        return EncryptionManager.drain(EncryptionManager.container_chunks(src, password), dst)
+
+class KeyCache:
+    def __init__(self, ttl=KEY_CACHE_TTL, max_sessions=KEY_CACHE_SESSIONS, max_entries=KEY_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        self.fingerprint_key = secrets.token_bytes(32)
+
+    def fingerprint(self, password):
+        return hmac.new(self.fingerprint_key, password.encode(), hashlib.sha256).digest()
+
+    def get_master_key(self, session_id, password, salt, iterations):
+        cache_key = (salt, iterations, self.fingerprint(password))
+        now = time.monotonic()
+        with self.lock:
+            entries = self.sessions.get(session_id)
+            if entries is not None:
+                entry = entries.get(cache_key)
+                if entry is not None and entry[1] > now:
+                    entries.move_to_end(cache_key)
+                    self.sessions.move_to_end(session_id)
+                    return entry[0]
+        master_key = EncryptionManager.derive_key(password, salt, iterations)
+        with self.lock:
+            entries = self.sessions.setdefault(session_id, OrderedDict())
+            self.sessions.move_to_end(session_id)
+            for key in [key for key, entry in entries.items() if entry[1] <= now]:
+                del entries[key]
+            entries[cache_key] = (master_key, now + self.ttl)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return master_key
+
+    def clear(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+key_cache = KeyCache()
+
+class SearchIndex:
+    NAME_WEIGHT = 3
+    PREFIX_WEIGHT = 0.5
+
+    def __init__(self):
+        self.postings = {}
+        self.documents = {}
+        self.vocabulary = []
+
+    @staticmethod
+    def tokenize(text):
+        if not isinstance(text, str):
+            return []
+        return re.findall(r"\w+", text.lower())
+
+    @classmethod
+    def document_terms(cls, item):
+        terms = {}
+        for token in cls.tokenize(item.get("name", "")):
+            terms[token] = terms.get(token, 0) + cls.NAME_WEIGHT
+        if item.get("type") != "file" and not item.get("encrypted", False):
+            for token in cls.tokenize(item.get("content", "")):
+                terms[token] = terms.get(token, 0) + 1
+        return terms
+
+    def rebuild(self, items):
+        self.postings = {}
+        self.documents = {}
+        for item in {item["id"]: item for item in items}.values():
+            self.index_terms(item)
+        self.vocabulary = sorted(self.postings)
+
+    def add(self, item):
+        self.remove(item["id"])
+        for token in self.index_terms(item):
+            bisect.insort(self.vocabulary, token)
+
+    def index_terms(self, item):
+        item_id = item["id"]
+        terms = self.document_terms(item)
+        self.documents[item_id] = terms
+        new_tokens = []
+        for token, weight in terms.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                new_tokens.append(token)
+            postings[item_id] = weight
+        return new_tokens
+
+    def remove(self, item_id):
+        terms = self.documents.pop(item_id, None)
+        if not terms:
+            return
+        for token in terms:
+            postings = self.postings[token]
+            del postings[item_id]
+            if not postings:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    def expand(self, token):
+        start = bisect.bisect_left(self.vocabulary, token)
+        end = bisect.bisect_left(self.vocabulary, token + "\uffff")
+        return self.vocabulary[start:end]
+
+    def search(self, query):
+        tokens = self.tokenize(query)
+        if not tokens:
+            return []
+        total = len(self.documents) or 1
+        scores = None
+        for token in dict.fromkeys(tokens):
+            token_scores = {}
+            for term in self.expand(token):
+                postings = self.postings[term]
+                weight = math.log(1 + total / len(postings))
+                if term != token:
+                    weight *= self.PREFIX_WEIGHT
+                for item_id, term_weight in postings.items():
+                    token_scores[item_id] = token_scores.get(item_id, 0) + term_weight * weight
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {item_id: score + token_scores[item_id] for item_id, score in scores.items() if item_id in token_scores}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda item_id: -scores[item_id])
+
+class SuggestIndex:
+    MAX_DISTANCE = 1
+    FUZZY_MIN_LENGTH = 3
+
+    def __init__(self):
+        self.keys = []
+        self.entries = {}
+        self.documents = {}
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(SearchIndex.tokenize(text))
+
+    @staticmethod
+    def document_phrases(item):
+        phrases = [("name", item.get("name")), ("category", item.get("category"))]
+        tags = item.get("tags")
+        if isinstance(tags, list):
+            phrases.extend(("tag", tag) for tag in tags)
+        return list(dict.fromkeys((kind, text.strip()) for kind, text in phrases if isinstance(text, str) and text.strip()))
+
+    @classmethod
+    def phrase_keys(cls, text):
+        tokens = SearchIndex.tokenize(text)
+        return [" ".join(tokens[start:]) for start in range(len(tokens))]
+
+    def rebuild(self, items):
+        self.entries = {}
+        self.documents = {}
+        for item in {item["id"]: item for item in items}.values():
+            self.index_phrases(item)
+        self.keys = sorted(self.entries)
+
+    def add(self, item):
+        self.remove(item["id"])
+        for key in self.index_phrases(item):
+            bisect.insort(self.keys, key)
+
+    def index_phrases(self, item):
+        phrases = self.document_phrases(item)
+        if not phrases:
+            return []
+        self.documents[item["id"]] = phrases
+        new_keys = []
+        for phrase in phrases:
+            for key in self.phrase_keys(phrase[1]):
+                entries = self.entries.get(key)
+                if entries is None:
+                    entries = self.entries[key] = {}
+                    new_keys.append(key)
+                entries[phrase] = entries.get(phrase, 0) + 1
+        return new_keys
+
+    def remove(self, item_id):
+        phrases = self.documents.pop(item_id, None)
+        if not phrases:
+            return
+        for phrase in phrases:
+            for key in self.phrase_keys(phrase[1]):
+                entries = self.entries[key]
+                ItemAggregates.bump(entries, phrase, -1)
+                if not entries:
+                    del self.entries[key]
+                    del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def key_range(self, prefix, start=0, end=None):
+        end = len(self.keys) if end is None else end
+        start = bisect.bisect_left(self.keys, prefix, start, end)
+        return start, bisect.bisect_left(self.keys, prefix + "\uffff", start, end)
+
+    def has_prefix(self, prefix):
+        start = bisect.bisect_left(self.keys, prefix)
+        return start < len(self.keys) and self.keys[start].startswith(prefix)
+
+    def children(self, prefix):
+        depth = len(prefix)
+        start, end = self.key_range(prefix)
+        while start < end:
+            key = self.keys[start]
+            if len(key) == depth:
+                start += 1
+                continue
+            char = key[depth]
+            yield char
+            start = self.key_range(prefix + char, start, end)[1]
+
+    @staticmethod
+    def step(query, prefix, char, row, previous):
+        # One row of the (Damerau) edit-distance table between query and prefix + char.
+        current = [row[0] + 1]
+        for j in range(1, len(query) + 1):
+            value = min(current[j - 1] + 1, row[j] + 1, row[j - 1] + (query[j - 1] != char))
+            if previous is not None and j > 1 and char == query[j - 2] and prefix[-1] == query[j - 1]:
+                value = min(value, previous[j - 2] + 1)
+            current.append(value)
+        return current
+
+    def walk(self, query, prefix, row, previous, matches):
+        if min(row) == 0:
+            chars = self.children(prefix)
+        else:
+            # Off the exact path only characters of the query can keep the distance in bounds.
+            chars = [char for char in sorted(set(query)) if self.has_prefix(prefix + char)]
+        for char in chars:
+            current = self.step(query, prefix, char, row, previous)
+            if min(current) > self.MAX_DISTANCE:
+                continue
+            child = prefix + char
+            if current[-1] <= self.MAX_DISTANCE:
+                matches[child] = current[-1]
+                if current[-1] == 0:
+                    continue
+            self.walk(query, child, current, row, matches)
+
+    def matches(self, query):
+        if len(query) < self.FUZZY_MIN_LENGTH:
+            return {query: 0}
+        # The first character is never treated as a typo, which keeps the walk to a narrow slice of keys.
+        root = list(range(len(query) + 1))
+        row = self.step(query, "", query[0], root, None)
+        matches = {}
+        if row[-1] <= self.MAX_DISTANCE:
+            matches[query[0]] = row[-1]
+        self.walk(query, query[0], row, root, matches)
+        return matches
+
+    def suggest(self, query, limit=10):
+        query = self.normalize(query)
+        if not query or limit <= 0:
+            return []
+        candidates = []
+        for prefix, distance in self.matches(query).items():
+            start, end = self.key_range(prefix)
+            candidates.extend((distance, key) for key in self.keys[start:min(end, start + limit)])
+        results = {}
+        for distance, key in sorted(candidates):
+            for (kind, text), count in self.entries[key].items():
+                if (kind, text) not in results:
+                    results[(kind, text)] = {"text": text, "kind": kind, "count": count, "distance": distance}
+            if len(results) >= limit:
+                break
+        return list(results.values())[:limit]
+
+class ItemAggregates:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.total = 0
+        self.encrypted = 0
+        self.by_type = {}
+        self.by_level = {}
+        self.by_category = {}
+
+    def rebuild(self, items):
+        self.reset()
+        for item in items:
+            self.add(item)
+
+    @staticmethod
+    def bump(counts, key, delta):
+        count = counts.get(key, 0) + delta
+        if count:
+            counts[key] = count
+        else:
+            counts.pop(key, None)
+
+    def apply(self, item, delta):
+        self.total += delta
+        if item.get("encrypted", False):
+            self.encrypted += delta
+        self.bump(self.by_type, item.get("type"), delta)
+        self.bump(self.by_level, item.get("level"), delta)
+        self.bump(self.by_category, item.get("category"), delta)
+
+    def add(self, item):
+        self.apply(item, 1)
+
+    def remove(self, item):
+        self.apply(item, -1)
+
+    def stats(self):
+        categories = {}
+        for category, count in self.by_category.items():
+            key = "Sin categoría" if category is None else category
+            categories[key] = categories.get(key, 0) + count
+        return {
+            "total_items": self.total,
+            "encrypted_items": self.encrypted,
+            "text_items": self.by_type.get("text", 0),
+            "password_items": self.by_type.get("password", 0),
+            "file_items": self.by_type.get("file", 0),
+            "note_items": self.by_type.get("note", 0),
+            "by_level": {str(level): self.by_level.get(level, 0) for level in range(1, 6)},
+            "categories": categories
+        }
+
+    def categories(self):
+        return [category for category in self.by_category if category]
+
+class BitmapIndex:
+    # Each item owns a bit position, assigned in insertion order; every filter value keeps an int bitset over those positions.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.slots = {}
+        self.ids = []
+        self.documents = {}
+        self.bitmaps = {}
+        self.live = 0
+
+    @staticmethod
+    def document_keys(item):
+        keys = [(field, item.get(field)) for field in ("category", "type", "level") if isinstance(item.get(field), (str, int))]
+        keys.append(("encrypted", bool(item.get("encrypted", False))))
+        tags = item.get("tags")
+        if isinstance(tags, list):
+            keys.extend(("tag", tag) for tag in dict.fromkeys(tag for tag in tags if isinstance(tag, str)))
+        return keys
+
+    def rebuild(self, items):
+        self.reset()
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        item_id = item["id"]
+        self.clear(item_id)
+        position = self.slots.get(item_id)
+        if position is None:
+            position = self.slots[item_id] = len(self.ids)
+            self.ids.append(item_id)
+        bit = 1 << position
+        keys = self.document_keys(item)
+        self.documents[item_id] = keys
+        for key in keys:
+            self.bitmaps[key] = self.bitmaps.get(key, 0) | bit
+        self.live |= bit
+
+    def clear(self, item_id):
+        keys = self.documents.pop(item_id, None)
+        if keys is None:
+            return
+        mask = ~(1 << self.slots[item_id])
+        for key in keys:
+            bitmap = self.bitmaps[key] & mask
+            if bitmap:
+                self.bitmaps[key] = bitmap
+            else:
+                del self.bitmaps[key]
+        self.live &= mask
+
+    def remove(self, item_id, keep_position=False):
+        self.clear(item_id)
+        if keep_position:
+            return
+        position = self.slots.pop(item_id, None)
+        if position is not None:
+            self.ids[position] = None
+        if len(self.ids) > 2 * len(self.slots) + 1024:
+            self.renumber()
+
+    def renumber(self):
+        documents = self.documents
+        item_ids = [item_id for item_id in self.ids if item_id in documents]
+        self.reset()
+        for position, item_id in enumerate(item_ids):
+            bit = 1 << position
+            self.slots[item_id] = position
+            self.ids.append(item_id)
+            self.documents[item_id] = documents[item_id]
+            for key in documents[item_id]:
+                self.bitmaps[key] = self.bitmaps.get(key, 0) | bit
+            self.live |= bit
+
+    def select(self, category="", item_type="", encrypted_only=False, level=None, tags=(), tags_mode="and"):
+        selected = [self.live]
+        if category:
+            selected.append(self.bitmaps.get(("category", category), 0))
+        if item_type:
+            selected.append(self.bitmaps.get(("type", item_type), 0))
+        if level is not None:
+            selected.append(self.bitmaps.get(("level", level), 0))
+        if encrypted_only:
+            selected.append(self.bitmaps.get(("encrypted", True), 0))
+        tag_bitmaps = [self.bitmaps.get(("tag", tag), 0) for tag in tags]
+        if tag_bitmaps and tags_mode == "or":
+            union = 0
+            for bitmap in tag_bitmaps:
+                union |= bitmap
+            selected.append(union)
+        else:
+            selected.extend(tag_bitmaps)
+        # Starting from the shortest bitmap keeps every intermediate int small.
+        selected.sort(key=lambda bitmap: bitmap.bit_length())
+        result = selected[0]
+        for bitmap in selected[1:]:
+            if not result:
+                break
+            result &= bitmap
+        return result
+
+    @staticmethod
+    def count(bitmap):
+        return bin(bitmap).count("1")
+
+    def item_ids(self, bitmap):
+        bits = bin(bitmap)[:1:-1]
+        position = bits.find("1")
+        while position >= 0:
+            yield self.ids[position]
+            position = bits.find("1", position + 1)
+
+    def filter_ids(self, bitmap, item_ids):
+        bits = bin(bitmap)[:1:-1]
+        selected = []
+        for item_id in item_ids:
+            position = self.slots.get(item_id)
+            if position is not None and position < len(bits) and bits[position] == "1":
+                selected.append(item_id)
+        return selected
+
+BLOB_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+SERVER_ITEM_FIELDS = ("blob", "size", "cipher", "kdf", "kdf_salt", "seq")
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.refs = {}
+        self.orphans = set()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest):
+        if not isinstance(digest, str) or not BLOB_DIGEST.match(digest):
+            raise ValueError("Blob no válido")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        try:
+            return os.path.isfile(self.path(digest))
+        except ValueError:
+            return False
+
+    def writer(self):
+        return BlobWriter(self)
+
+    def put(self, data):
+        writer = self.writer()
+        writer.write(data)
+        return writer.commit()
+
+    def put_stream(self, src):
+        writer = self.writer()
+        try:
+            shutil.copyfileobj(src, writer, STREAM_CHUNK_SIZE)
+        except Exception:
+            writer.discard()
+            raise
+        return writer.commit(), writer.size
+
+    def open(self, digest):
+        return open(self.path(digest), "rb")
+
+    def read(self, digest):
+        with self.open(digest) as f:
+            return f.read()
+
+    def add_ref(self, digest, count=1):
+        with self.lock:
+            self.refs[digest] = self.refs.get(digest, 0) + count
+            self.orphans.discard(digest)
+
+    def release(self, digest, count=1):
+        with self.lock:
+            remaining = self.refs.get(digest, 0) - count
+            if remaining > 0:
+                self.refs[digest] = remaining
+            else:
+                self.refs.pop(digest, None)
+                self.orphans.add(digest)
+
+    def collect(self):
+        with self.lock:
+            cutoff = time.time() - BLOB_GRACE_SECONDS
+            for digest in list(self.orphans):
+                if digest not in self.refs:
+                    try:
+                        if BLOB_GRACE_SECONDS and os.path.getmtime(self.path(digest)) > cutoff:
+                            continue
+                        os.remove(self.path(digest))
+                    except (FileNotFoundError, ValueError):
+                        pass
+                self.orphans.discard(digest)
+
+    def forget(self, digests):
+        with self.lock:
+            self.orphans.update(digest for digest in digests if digest not in self.refs)
+        self.collect()
+
+    def sweep(self):
+        # Blobs written for changes that never committed have no reference left to release.
+        cutoff = time.time() - BLOB_GRACE_SECONDS
+        with self.lock:
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        if os.path.getmtime(path) > cutoff:
+                            continue
+                        if name.startswith("tmp-"):
+                            os.remove(path)
+                        elif BLOB_DIGEST.match(name) and name not in self.refs:
+                            self.orphans.add(name)
+                    except FileNotFoundError:
+                        pass
+        self.collect()
+
+class BlobWriter:
+    def __init__(self, store):
+        self.store = store
+        self.temp_path = os.path.join(store.root, f"tmp-{secrets.token_hex(8)}")
+        self.file = open(self.temp_path, "wb")
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        self.file.write(data)
+        return len(data)
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        digest = self.hasher.hexdigest()
+        path = self.store.path(digest)
+        with self.store.lock:
+            self.store.orphans.discard(digest)
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            else:
+                os.remove(self.temp_path)
+                return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.temp_path, path)
+        return digest
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+class ItemIndexes:
+    SUMMARY_FIELDS = ("type", "encrypted", "level", "category", "blob")
+
+    def __init__(self, blobs=None):
+        self.summaries = {}
+        self.search = SearchIndex()
+        self.suggest = SuggestIndex()
+        self.aggregates = ItemAggregates()
+        self.bitmaps = BitmapIndex()
+        self.blobs = blobs
+        self.blob_refs = {}
+
+    def rebuild(self, items):
+        self.summaries = {item["id"]: self.summary(item) for item in items}
+        self.search.rebuild(items)
+        self.suggest.rebuild(items)
+        self.aggregates.rebuild(items)
+        self.bitmaps.rebuild(items)
+        if self.blobs is not None:
+            for digest, count in self.blob_refs.items():
+                self.blobs.release(digest, count)
+            self.blob_refs = {}
+            for item in items:
+                self.add_blob_ref(item)
+
+    @classmethod
+    def summary(cls, item):
+        return {"id": item["id"], **{field: item[field] for field in cls.SUMMARY_FIELDS if field in item}}
+
+    def add(self, item):
+        self.summaries[item["id"]] = self.summary(item)
+        self.search.add(item)
+        self.suggest.add(item)
+        self.aggregates.add(item)
+        self.bitmaps.add(item)
+        self.add_blob_ref(item)
+
+    def remove(self, item, keep_position=False):
+        self.summaries.pop(item["id"], None)
+        self.search.remove(item["id"])
+        self.suggest.remove(item["id"])
+        self.aggregates.remove(item)
+        self.bitmaps.remove(item["id"], keep_position)
+        digest = item.get("blob")
+        if digest and self.blobs is not None:
+            ItemAggregates.bump(self.blob_refs, digest, -1)
+            self.blobs.release(digest)
+
+    def discard(self, item_id, keep_position=False):
+        summary = self.summaries.get(item_id)
+        if summary is not None:
+            self.remove(summary, keep_position)
+
+    def add_blob_ref(self, item):
+        digest = item.get("blob")
+        if digest and self.blobs is not None:
+            ItemAggregates.bump(self.blob_refs, digest, 1)
+            self.blobs.add_ref(digest)
+
+    def collect(self):
+        if self.blobs is not None:
+            self.blobs.collect()
+
+def number_items(items):
+    # Items written before insertion numbers existed get theirs from file order, identically in every process.
+    last_seq = max((item["seq"] for item in items if "seq" in item), default=0)
+    for item in items:
+        if "seq" not in item:
+            last_seq += 1
+            item["seq"] = last_seq
+    return last_seq
+
+def item_change(old_item, item):
+    if item is None:
+        return {"id": old_item["id"], "op": "delete"}
+    if old_item is None:
+        return {"id": item["id"], "op": "add", "fields": {k: v for k, v in item.items() if k != "id"}}
+    fields = {k: v for k, v in item.items() if k not in old_item or old_item[k] != v}
+    fields.update((k, None) for k in old_item if k not in item)
+    return {"id": item["id"], "op": "update", "fields": fields}
+
+def missing_batch_targets(operations, exists):
+    # Replays the batch against existence only, so an update after a delete of the same id is rejected too.
+    present = {}
+    missing = []
+    for index, operation in enumerate(operations):
+        if operation[0] == "add":
+            present[operation[1]["id"]] = True
+            continue
+        item_id = operation[1]
+        if item_id not in present:
+            present[item_id] = exists(item_id)
+        if present[item_id]:
+            present[item_id] = operation[0] == "update"
+        else:
+            missing.append(index)
+    return missing
+
+class ItemEvents:
+    def __init__(self, revision=0, size=EVENT_HISTORY):
+        self.history = deque(maxlen=size)
+        self.floor = revision
+        self.latest = revision
+        self.condition = threading.Condition()
+
+    def publish(self, events):
+        with self.condition:
+            for event in events:
+                if len(self.history) == self.history.maxlen:
+                    self.floor = self.history[0]["rev"]
+                self.history.append(event)
+                self.latest = max(self.latest, event["rev"])
+            self.condition.notify_all()
+
+    def notify(self, revision):
+        with self.condition:
+            self.latest = max(self.latest, revision)
+            self.condition.notify_all()
+
+    def since(self, revision):
+        with self.condition:
+            if revision < self.floor or revision > self.latest:
+                return None
+            events = []
+            for event in reversed(self.history):
+                if event["rev"] <= revision:
+                    break
+                events.append(event)
+            return events[::-1]
+
+    def wait(self, revision, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.latest > revision, timeout)
+
+class ItemStore:
+    def __init__(self, path, blobs=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.file_lock = FileLock(path + ".lock")
+        self.items = []
+        self.index = {}
+        self.stamp = None
+        self.pinned = None
+        self.revision = 0
+        self.last_seq = 0
+        self.events = None
+        self.indexes = ItemIndexes(blobs)
+        with self.file_lock:
+            self.load()
+
+    def close(self):
+        with self.lock:
+            if self.pinned is not None:
+                self.pinned.close()
+                self.pinned = None
+
+    def track_snapshot(self):
+        if self.pinned is not None:
+            self.pinned.close()
+            self.pinned = None
+        self.stamp = file_stamp(self.path)
+        if self.stamp is not None and os.name != "nt":
+            # An open handle keeps the inode from being reused, so a new snapshot always gets a new stamp.
+            self.pinned = open(self.path, "rb")
+
+    def read_snapshot(self):
+        self.track_snapshot()
+        if not os.path.exists(self.path):
+            return [], 0
+        with open(self.path, "rb") as f:
+            return decode_snapshot(f.read())
+
+    def load(self):
+        with self.lock:
+            previous = self.index
+            self.items, self.revision = self.read_snapshot()
+            self.last_seq = number_items(self.items)
+            self.index = {item["id"]: item for item in self.items}
+            self.rebuild_indexes()
+            if self.events is None:
+                self.events = ItemEvents(self.revision)
+            else:
+                # A full reload has no per-record history, so the difference is published under the new revision.
+                changes = [item_change(previous.get(item["id"]), item) for item in self.items if previous.get(item["id"]) != item]
+                changes.extend(item_change(item, None) for item_id, item in previous.items() if item_id not in self.index)
+                self.events.publish([{"rev": self.revision, **change} for change in changes])
+                self.events.notify(self.revision)
+
+    def changed(self):
+        return file_stamp(self.path) != self.stamp
+
+    def refresh(self):
+        if self.changed():
+            with self.file_lock, self.lock:
+                if self.changed():
+                    self.load()
+
+    def current_revision(self):
+        self.refresh()
+        return self.revision
+
+    def rebuild_indexes(self):
+        self.indexes.rebuild(self.items)
+
+    def write_snapshot(self, items, revision):
+        write_file_atomic(self.path, encode_snapshot(items, revision))
+        with self.lock:
+            self.track_snapshot()
+
+    def save(self):
+        with self.lock:
+            self.write_snapshot(self.items, self.revision)
+
+    def all(self):
+        self.refresh()
+        with self.lock:
+            return list(self.items)
+
+    def iter_items(self):
+        return iter(self.all())
+
+    def page_after(self, after, limit, reverse=False):
+        self.refresh()
+        with self.lock:
+            items = reversed(self.items) if reverse else self.items
+            if after is not None:
+                items = (item for item in items if (item["seq"] < after if reverse else item["seq"] > after))
+            return list(itertools.islice(items, limit))
+
+    def get(self, item_id):
+        self.refresh()
+        return self.index.get(item_id)
+
+    def assign_seq(self, item):
+        self.last_seq += 1
+        item["seq"] = self.last_seq
+
+    def add(self, item):
+        with self.file_lock, self.lock:
+            self.refresh()
+            self.assign_seq(item)
+            self.items.append(item)
+            self.index[item["id"]] = item
+            self.indexes.add(item)
+            self.commit("put", item["id"], item, item_change(None, item))
+        return item
+
+    def update(self, item_id, data):
+        return self.update_many([(item_id, data)])[0]
+
+    def update_many(self, updates):
+        with self.file_lock, self.lock:
+            self.refresh()
+            results = []
+            records = []
+            changes = []
+            replaced = {}
+            for item_id, data in updates:
+                old_item = self.index.get(item_id)
+                if old_item is None:
+                    results.append(None)
+                    continue
+                item = {**old_item, **{k: v for k, v in data.items() if k != "id"}}
+                changes.append(item_change(old_item, item))
+                self.indexes.remove(old_item, keep_position=True)
+                self.index[item_id] = replaced[item_id] = item
+                self.indexes.add(item)
+                results.append(item)
+                records.append(("put", item_id, item))
+            if records:
+                self.swap_items(replaced)
+                self.commit_many(records, changes)
+                self.indexes.collect()
+            return results
+
+    def delete(self, item_id):
+        with self.file_lock, self.lock:
+            self.refresh()
+            item = self.index.pop(item_id, None)
+            if item is None:
+                return None
+            self.items = [i for i in self.items if i is not item]
+            self.indexes.remove(item)
+            self.commit("delete", item_id, None, item_change(item, None))
+            self.indexes.collect()
+            return item
+
+    def replace_all(self, items):
+        staged = list(items)
+        for seq, item in enumerate(staged, 1):
+            item["seq"] = seq
+        with self.file_lock, self.lock:
+            self.refresh()
+            self.items = staged
+            self.last_seq = len(staged)
+            self.index = {item["id"]: item for item in self.items}
+            self.rebuild_indexes()
+            self.revision += 1
+            self.save()
+            self.publish([{"op": "reset"}])
+            self.indexes.collect()
+            return len(staged)
+
+    def upsert_many(self, items):
+        with self.file_lock, self.lock:
+            self.refresh()
+            inserted = updated = skipped = 0
+            records = []
+            changes = []
+            replaced = {}
+            for item in items:
+                old_item = self.index.get(item["id"])
+                if old_item is not None:
+                    item["seq"] = old_item["seq"]
+                if old_item == item:
+                    skipped += 1
+                    continue
+                changes.append(item_change(old_item, item))
+                if old_item is None:
+                    self.assign_seq(item)
+                    self.items.append(item)
+                    inserted += 1
+                else:
+                    self.indexes.remove(old_item, keep_position=True)
+                    replaced[item["id"]] = item
+                    updated += 1
+                self.index[item["id"]] = item
+                self.indexes.add(item)
+                records.append(("put", item["id"], item))
+            if records:
+                self.swap_items(replaced)
+                self.commit_many(records, changes)
+                self.indexes.collect()
+            return inserted, updated, skipped
+
+    def apply_batch(self, operations):
+        with self.file_lock, self.lock:
+            self.refresh()
+            missing = missing_batch_targets(operations, lambda item_id: item_id in self.index)
+            if missing:
+                return None, missing
+            results = []
+            records = []
+            changes = []
+            replaced = {}
+            removed = set()
+            for operation in operations:
+                if operation[0] == "add":
+                    item = operation[1]
+                    self.assign_seq(item)
+                    self.items.append(item)
+                    self.index[item["id"]] = item
+                    self.indexes.add(item)
+                    changes.append(item_change(None, item))
+                    records.append(("put", item["id"], item))
+                elif operation[0] == "update":
+                    old_item = self.index[operation[1]]
+                    item = {**old_item, **{k: v for k, v in operation[2].items() if k != "id"}}
+                    changes.append(item_change(old_item, item))
+                    self.indexes.remove(old_item, keep_position=True)
+                    self.index[item["id"]] = replaced[item["id"]] = item
+                    self.indexes.add(item)
+                    records.append(("put", item["id"], item))
+                else:
+                    item = self.index.pop(operation[1])
+                    removed.add(operation[1])
+                    self.indexes.remove(item)
+                    changes.append(item_change(item, None))
+                    records.append(("delete", item["id"], None))
+                results.append(item)
+            if replaced or removed:
+                self.swap_items(replaced, removed)
+            self.commit_many(records, changes)
+            self.indexes.collect()
+            return results, []
+
+    def swap_items(self, replaced, removed=()):
+        # Stored dicts are never changed in place, so anything already handed to a reader keeps a consistent state.
+        self.items = [replaced.get(item["id"], item) for item in self.items if item["id"] not in removed]
+
+    def commit(self, op, item_id, item, change):
+        self.commit_many([(op, item_id, item)], [change])
+
+    def commit_many(self, records, changes):
+        self.revision += len(records)
+        self.save()
+        self.publish(changes)
+
+    def publish(self, changes):
+        first = self.revision - len(changes) + 1
+        self.events.publish([{"rev": first + offset, **change} for offset, change in enumerate(changes)])
+
+    def events_since(self, revision):
+        self.refresh()
+        return self.events.since(revision)
+
+    def wait_events(self, revision, timeout):
+        self.events.wait(revision, timeout)
+
+    def query(self, search="", **filters):
+        if not search and not filters:
+            return self.all()
+        self.refresh()
+        with self.lock:
+            bitmap = self.indexes.bitmaps.select(**filters)
+            if search:
+                item_ids = self.indexes.bitmaps.filter_ids(bitmap, self.indexes.search.search(search))
+            else:
+                item_ids = self.indexes.bitmaps.item_ids(bitmap)
+            return [self.index[item_id] for item_id in item_ids]
+
+    def count(self, **filters):
+        self.refresh()
+        with self.lock:
+            return BitmapIndex.count(self.indexes.bitmaps.select(**filters))
+
+    def stats(self):
+        self.refresh()
+        with self.lock:
+            return self.indexes.aggregates.stats()
+
+    def categories(self):
+        self.refresh()
+        with self.lock:
+            return self.indexes.aggregates.categories()
+
+    def suggest(self, query, limit=10):
+        self.refresh()
+        with self.lock:
+            return self.indexes.suggest.suggest(query, limit)
+
+class JournaledItemStore(ItemStore):
+    def __init__(self, path, journal_path, blobs=None, compact_bytes=JOURNAL_COMPACT_BYTES, fsync_interval=JOURNAL_FSYNC_INTERVAL):
+        self.journal_path = journal_path
+        self.old_journal_path = journal_path + ".old"
+        self.compact_bytes = compact_bytes
+        self.fsync_interval = fsync_interval
+        self.journal = None
+        self.journal_ino = None
+        self.journal_offset = 0
+        self.dirty = False
+        self.compacting = False
+        self.closed = False
+        self.wakeup = threading.Event()
+        super().__init__(path, blobs)
+        self.flusher = threading.Thread(target=self.flush_loop, daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def open_journal(self):
+        stamp = file_stamp(self.journal_path)
+        if self.closed or self.journal is not None and stamp is not None and stamp[0] == self.journal_ino:
+            return
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(self.journal_path, "ab")
+        self.journal_ino = os.fstat(self.journal.fileno()).st_ino
+
+    def read_snapshot(self):
+        items, revision = super().read_snapshot()
+        index = {item["id"]: item for item in items}
+        self.open_journal()
+        self.journal_offset = 0
+        for journal_path in (self.old_journal_path, self.journal_path):
+            records, self.journal_offset = self.read_journal(journal_path)
+            revision = self.apply_records(index, records, revision)
+        self.trim_journal()
+        return list(index.values()), revision
+
+    @staticmethod
+    def apply_records(index, records, revision):
+        for record in records:
+            # A crash between writing a snapshot and truncating the journal leaves records the snapshot already holds.
+            if record.get("rev", revision + 1) <= revision:
+                continue
+            revision = record.get("rev", revision + 1)
+            if record["op"] == "put":
+                index[record["id"]] = record["item"]
+            elif record["op"] == "delete":
+                index.pop(record["id"], None)
+        return revision
+
+    @classmethod
+    def read_files(cls, path, journal_path=None):
+        items, revision = [], 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                items, revision = decode_snapshot(f.read())
+        index = {item["id"]: item for item in items}
+        for name in (journal_path + ".old", journal_path) if journal_path else ():
+            revision = cls.apply_records(index, cls.read_journal(name)[0], revision)
+        return list(index.values()), revision
+
+    @classmethod
+    def fold(cls, path, journal_path):
+        if not any(os.path.exists(name) for name in (journal_path, journal_path + ".old")):
+            return
+        with FileLock(path + ".lock"):
+            items, revision = cls.read_files(path, journal_path)
+            write_file_atomic(path, encode_snapshot(items, revision))
+            for name in (journal_path + ".old", journal_path):
+                if os.path.exists(name):
+                    os.remove(name)
+
+    @staticmethod
+    def read_journal(journal_path, offset=0):
+        records = []
+        if not os.path.exists(journal_path):
+            return records, offset
+        with open(journal_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                offset += len(line)
+        return records, offset
+
+    def trim_journal(self):
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > self.journal_offset:
+            os.truncate(self.journal_path, self.journal_offset)
+
+    def replay_tail(self):
+        records, self.journal_offset = self.read_journal(self.journal_path, self.journal_offset)
+        self.trim_journal()
+        events = []
+        for record in records:
+            if record.get("rev", self.revision + 1) <= self.revision:
+                continue
+            self.revision = record.get("rev", self.revision + 1)
+            old_item = self.index.pop(record["id"], None)
+            if old_item is not None:
+                self.indexes.remove(old_item, keep_position=record["op"] == "put")
+            if record["op"] == "put":
+                item = record["item"]
+                self.last_seq = max(self.last_seq, item.get("seq", 0))
+                if old_item is None:
+                    self.items.append(item)
+                else:
+                    self.items[self.items.index(old_item)] = item
+                self.index[item["id"]] = item
+                self.indexes.add(item)
+                events.append({"rev": self.revision, **item_change(old_item, item)})
+            elif old_item is not None:
+                self.items = [i for i in self.items if i is not old_item]
+                events.append({"rev": self.revision, **item_change(old_item, None)})
+        self.events.publish(events)
+        self.events.notify(self.revision)
+
+    def journal_changed(self):
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_ino, stat.st_size) != (self.journal_ino, self.journal_offset)
+
+    def changed(self):
+        return super().changed() or self.journal_changed()
+
+    def refresh(self):
+        if not self.changed():
+            return
+        with self.file_lock, self.lock:
+            if super().changed():
+                self.load()
+            elif self.journal_changed():
+                stamp = file_stamp(self.journal_path)
+                if stamp is None or stamp[0] != self.journal_ino or stamp[2] < self.journal_offset:
+                    self.load()
+                else:
+                    self.replay_tail()
+
+    def commit_many(self, records, changes):
+        lines = []
+        for op, item_id, item in records:
+            self.revision += 1
+            record = {"op": op, "id": item_id, "rev": self.revision}
+            if item is not None:
+                record["item"] = item
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        data = "".join(lines).encode("utf-8")
+        self.journal.write(data)
+        self.journal.flush()
+        self.journal_offset += len(data)
+        self.dirty = True
+        if self.journal_offset >= self.compact_bytes and not self.compacting:
+            self.compacting = True
+            self.wakeup.set()
+        self.publish(changes)
+
+    def flush_loop(self):
+        while not self.closed:
+            self.wakeup.wait(self.fsync_interval)
+            self.wakeup.clear()
+            try:
+                self.sync()
+                if self.compacting:
+                    try:
+                        self.compact()
+                    finally:
+                        self.compacting = False
+            except Exception as e:
+                # Keep the thread alive: a failed fsync stays dirty and compaction is retried on the next write.
+                print(f"⚠ Error al sincronizar el journal {self.journal_path}: {e}")
+
+    def sync(self):
+        with self.lock:
+            if not self.dirty or self.journal is None:
+                return
+            fd = os.dup(self.journal.fileno())
+            self.dirty = False
+        try:
+            os.fsync(fd)
+        except OSError:
+            with self.lock:
+                self.dirty = True
+            raise
+        finally:
+            os.close(fd)
+
+    def compact(self):
+        with self.file_lock:
+            with self.lock:
+                if self.journal is None:
+                    return
+                self.refresh()
+                snapshot = [dict(item) for item in self.items]
+                revision = self.revision
+                if os.path.exists(self.old_journal_path):
+                    # An earlier compaction failed after rotating; persist its records before the rotation below replaces them.
+                    self.write_snapshot(snapshot, revision)
+                    os.remove(self.old_journal_path)
+                self.journal.close()
+                self.journal = None
+                os.replace(self.journal_path, self.old_journal_path)
+                self.open_journal()
+                self.journal_offset = 0
+                self.dirty = False
+            self.write_snapshot(snapshot, revision)
+            os.remove(self.old_journal_path)
+
+    def save(self):
+        with self.file_lock, self.lock:
+            self.write_snapshot(self.items, self.revision)
+            if self.journal is not None:
+                self.journal.truncate(0)
+                self.journal_offset = 0
+                self.dirty = False
+            if os.path.exists(self.old_journal_path):
+                os.remove(self.old_journal_path)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.wakeup.set()
+            if self.journal is not None:
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+                self.journal.close()
+                self.journal = None
+        atexit.unregister(self.close)
+        super().close()
+
+class SqliteItemStore:
+    INSERT_SQL = "INSERT INTO items (id, category, type, encrypted, level, created, modified, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    UPDATE_SQL = "UPDATE items SET category = ?, type = ?, encrypted = ?, level = ?, created = ?, modified = ?, data = ? WHERE id = ?"
+
+    def __init__(self, path, json_path=None, blobs=None, journal_path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.local = threading.local()
+        self.connections = weakref.WeakKeyDictionary()
+        conn = self.connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        # SQLite only persists items: filters, search and stats run on the in-memory ItemIndexes,
+        # so the old per-column indexes were never read and only slowed down writes.
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS items (
+                seq INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                category TEXT,
+                type TEXT,
+                encrypted INTEGER NOT NULL DEFAULT 0,
+                level INTEGER NOT NULL DEFAULT 0,
+                created TEXT,
+                modified TEXT,
+                data TEXT NOT NULL
+            );
+            DROP INDEX IF EXISTS idx_items_category;
+            DROP INDEX IF EXISTS idx_items_type;
+            DROP INDEX IF EXISTS idx_items_encrypted;
+            DROP INDEX IF EXISTS idx_items_level;
+            DROP INDEX IF EXISTS idx_items_created;
+            DROP INDEX IF EXISTS idx_items_modified;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', '0');
+            CREATE TABLE IF NOT EXISTS events (rev INTEGER PRIMARY KEY, data TEXT NOT NULL);
+        """)
+        if json_path:
+            self.migrate_from_json(json_path, journal_path)
+        self.indexes = ItemIndexes(blobs)
+        self.revision = self.read_revision()
+        self.events = ItemEvents(self.revision)
+        self.rebuild_indexes()
+
+    def rebuild_indexes(self, items=None):
+        if items is None:
+            items = self.all()
+        self.indexes.rebuild(items)
+
+    def read_revision(self):
+        return int(self.connect().execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0])
+
+    def refresh(self):
+        if self.read_revision() != self.revision:
+            with self.lock:
+                revision = self.read_revision()
+                if revision != self.revision:
+                    self.sync_indexes(revision)
+
+    def current_revision(self):
+        return self.read_revision()
+
+    def begin_write(self, conn):
+        conn.execute("UPDATE meta SET value = value WHERE key = 'revision'")
+        revision = self.read_revision()
+        if revision != self.revision:
+            self.sync_indexes(revision)
+
+    def sync_indexes(self, revision):
+        # Other processes' commits are replayed from the events table; only a reset or a gap forces a full rebuild.
+        rows = self.connect().execute("SELECT data FROM events WHERE rev > ? AND rev <= ? ORDER BY rev", (self.revision, revision)).fetchall()
+        events = [json.loads(row[0]) for row in rows]
+        if len(events) != revision - self.revision or any(event["op"] == "reset" for event in events):
+            self.rebuild_indexes()
+        else:
+            item_ids = list(dict.fromkeys(event["id"] for event in events))
+            found = {item["id"]: item for item in self.select_ids(item_ids)}
+            for item_id in item_ids:
+                self.indexes.discard(item_id, keep_position=item_id in found)
+                if item_id in found:
+                    self.indexes.add(found[item_id])
+        self.revision = revision
+
+    def end_write(self, conn, changes):
+        if changes:
+            first = self.revision + 1
+            self.revision += len(changes)
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'revision'", (str(self.revision),))
+            events = [{"rev": first + offset, **change} for offset, change in enumerate(changes)]
+            conn.executemany("INSERT OR REPLACE INTO events (rev, data) VALUES (?, ?)",
+                             [(event["rev"], json.dumps(event, ensure_ascii=False, separators=(",", ":"))) for event in events])
+            conn.execute("DELETE FROM events WHERE rev <= ?", (self.revision - EVENT_HISTORY,))
+            self.events.notify(self.revision)
+
+    def events_since(self, revision):
+        conn = self.connect()
+        with self.lock:
+            current = self.read_revision()
+            rows = conn.execute("SELECT rev, data FROM events WHERE rev > ? ORDER BY rev", (revision,)).fetchall()
+        if revision > current:
+            return None
+        # Every revision writes exactly one event row, so a gap means the history was pruned or bypassed.
+        if current > revision and (not rows or rows[0][0] != revision + 1):
+            return None
+        return [json.loads(data) for _, data in rows]
+
+    def wait_events(self, revision, timeout):
+        self.events.wait(revision, timeout)
+
+    def connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Connections stay per thread; check_same_thread is off only so close() can release them all.
+            # They are keyed weakly by thread, so a finished request thread drops (and closes) its connection.
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            with self.lock:
+                self.connections[threading.current_thread()] = conn
+        return conn
+
+    def close(self):
+        with self.lock:
+            for conn in list(self.connections.values()):
+                conn.close()
+            self.connections.clear()
+
+    def migrate_from_json(self, json_path, journal_path=None):
+        conn = self.connect()
+        if conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_json'").fetchone():
+            return
+        # Journal mode only writes items.json on compaction, so the journal holds the most recent items.
+        with FileLock(json_path + ".lock"):
+            items, _ = JournaledItemStore.read_files(json_path, journal_path)
+        with self.lock, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_json'").fetchone():
+                return
+            if items and not conn.execute("SELECT 1 FROM items LIMIT 1").fetchone():
+                conn.executemany(self.INSERT_SQL, [self.row(item) for item in items])
+                conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'revision'")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', ?)", (datetime.now().isoformat(),))
+
+    @staticmethod
+    def row(item):
+        return (
+            item["id"],
+            item.get("category"),
+            item.get("type"),
+            1 if item.get("encrypted", False) else 0,
+            item.get("level") or 0,
+            item.get("created"),
+            item.get("modified"),
+            json.dumps({k: v for k, v in item.items() if k != "seq"}, ensure_ascii=False, separators=(",", ":"))
+        )
+
+    @staticmethod
+    def load_row(row):
+        item = json.loads(row[1])
+        item["seq"] = row[0]
+        return item
+
+    def select(self, where="", params=()):
+        rows = self.connect().execute(f"SELECT seq, data FROM items {where} ORDER BY seq", params)
+        return [self.load_row(row) for row in rows]
+
+    def select_ids(self, item_ids):
+        items = []
+        for start in range(0, len(item_ids), 500):
+            chunk = item_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            items.extend(self.select(f"WHERE id IN ({placeholders})", chunk))
+        return items
+
+    def all(self):
+        return self.select()
+
+    def iter_items(self):
+        for row in self.connect().execute("SELECT seq, data FROM items ORDER BY seq"):
+            yield self.load_row(row)
+
+    def page_after(self, after, limit, reverse=False):
+        where = "" if after is None else ("WHERE seq < ?" if reverse else "WHERE seq > ?")
+        params = () if after is None else (after,)
+        rows = self.connect().execute(f"SELECT seq, data FROM items {where} ORDER BY seq {'DESC' if reverse else 'ASC'} LIMIT ?", params + (limit,))
+        return [self.load_row(row) for row in rows]
+
+    def get(self, item_id):
+        row = self.connect().execute("SELECT seq, data FROM items WHERE id = ?", (item_id,)).fetchone()
+        return self.load_row(row) if row else None
+
+    def add(self, item):
+        conn = self.connect()
+        with self.lock, conn:
+            self.begin_write(conn)
+            item["seq"] = conn.execute(self.INSERT_SQL, self.row(item)).lastrowid
+            self.indexes.add(item)
+            self.end_write(conn, [item_change(None, item)])
+        return item
+
+    def update(self, item_id, data):
+        return self.update_many([(item_id, data)])[0]
+
+    def update_many(self, updates):
+        conn = self.connect()
+        results = []
+        changes = []
+        with self.lock, conn:
+            self.begin_write(conn)
+            for item_id, data in updates:
+                old_item = self.get(item_id)
+                if old_item is None:
+                    results.append(None)
+                    continue
+                item = dict(old_item)
+                item.update({k: v for k, v in data.items() if k != "id"})
+                conn.execute(self.UPDATE_SQL, self.row(item)[1:] + (item_id,))
+                self.indexes.remove(old_item, keep_position=True)
+                self.indexes.add(item)
+                results.append(item)
+                changes.append(item_change(old_item, item))
+            self.end_write(conn, changes)
+        self.indexes.collect()
+        return results
+
+    def delete(self, item_id):
+        conn = self.connect()
+        with self.lock, conn:
+            self.begin_write(conn)
+            item = self.get(item_id)
+            if item is not None:
+                conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
+                self.indexes.remove(item)
+                self.end_write(conn, [item_change(item, None)])
+        self.indexes.collect()
+        return item
+
+    def apply_batch(self, operations):
+        conn = self.connect()
+        results = []
+        changes = []
+        with self.lock, conn:
+            self.begin_write(conn)
+            missing = missing_batch_targets(operations, lambda item_id: conn.execute("SELECT 1 FROM items WHERE id = ?", (item_id,)).fetchone() is not None)
+            if missing:
+                return None, missing
+            for operation in operations:
+                if operation[0] == "add":
+                    item = operation[1]
+                    item["seq"] = conn.execute(self.INSERT_SQL, self.row(item)).lastrowid
+                    self.indexes.add(item)
+                    changes.append(item_change(None, item))
+                elif operation[0] == "update":
+                    old_item = self.get(operation[1])
+                    item = dict(old_item)
+                    item.update({k: v for k, v in operation[2].items() if k != "id"})
+                    conn.execute(self.UPDATE_SQL, self.row(item)[1:] + (item["id"],))
+                    self.indexes.remove(old_item, keep_position=True)
+                    self.indexes.add(item)
+                    changes.append(item_change(old_item, item))
+                else:
+                    item = self.get(operation[1])
+                    conn.execute("DELETE FROM items WHERE id = ?", (item["id"],))
+                    self.indexes.remove(item)
+                    changes.append(item_change(item, None))
+                results.append(item)
+            self.end_write(conn, changes)
+        self.indexes.collect()
+        return results, []
+
+    def replace_all(self, items):
+        conn = self.connect()
+        with self.lock, conn:
+            self.begin_write(conn)
+            conn.execute("DELETE FROM items")
+            # Rows are streamed into the open transaction; an error half way rolls the whole replacement back.
+            count = conn.executemany(self.INSERT_SQL, (self.row(item) for item in items)).rowcount
+            self.rebuild_indexes()
+            self.end_write(conn, [{"op": "reset"}])
+        self.indexes.collect()
+        return count
+
+    def upsert_many(self, items):
+        conn = self.connect()
+        inserted = updated = skipped = 0
+        changes = []
+        with self.lock, conn:
+            self.begin_write(conn)
+            for item in items:
+                old_item = self.get(item["id"])
+                if old_item is not None:
+                    item["seq"] = old_item["seq"]
+                if old_item == item:
+                    skipped += 1
+                    continue
+                if old_item is None:
+                    item["seq"] = conn.execute(self.INSERT_SQL, self.row(item)).lastrowid
+                    inserted += 1
+                else:
+                    conn.execute(self.UPDATE_SQL, self.row(item)[1:] + (item["id"],))
+                    self.indexes.remove(old_item, keep_position=True)
+                    updated += 1
+                changes.append(item_change(old_item, item))
+                self.indexes.add(item)
+            self.end_write(conn, changes)
+        self.indexes.collect()
+        return inserted, updated, skipped
+
+    def query(self, search="", **filters):
+        if not search and not filters:
+            return self.select()
+        self.refresh()
+        with self.lock:
+            bitmap = self.indexes.bitmaps.select(**filters)
+            if search:
+                item_ids = self.indexes.bitmaps.filter_ids(bitmap, self.indexes.search.search(search))
+            else:
+                item_ids = list(self.indexes.bitmaps.item_ids(bitmap))
+        found = {item["id"]: item for item in self.select_ids(item_ids)}
+        return [found[item_id] for item_id in item_ids if item_id in found]
+
+    def count(self, **filters):
+        self.refresh()
+        with self.lock:
+            return BitmapIndex.count(self.indexes.bitmaps.select(**filters))
+
+    def stats(self):
+        self.refresh()
+        with self.lock:
+            return self.indexes.aggregates.stats()
+
+    def categories(self):
+        self.refresh()
+        with self.lock:
+            return self.indexes.aggregates.categories()
+
+    def suggest(self, query, limit=10):
+        self.refresh()
+        with self.lock:
+            return self.indexes.suggest.suggest(query, limit)
+
+def create_item_store(root, blobs):
+    items_file = os.path.join(root, "items.json")
+    if STORAGE_MODE == "sqlite":
+        return SqliteItemStore(os.path.join(root, "items.db"), items_file, blobs, os.path.join(root, "items.journal"))
+    if STORAGE_MODE == "journal":
+        return JournaledItemStore(items_file, os.path.join(root, "items.journal"), blobs)
+    JournaledItemStore.fold(items_file, os.path.join(root, "items.journal"))
+    return ItemStore(items_file, blobs)
+
+class Vault:
+    def __init__(self, root):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.lock = FileLock(os.path.join(root, "vault.lock"))
+        self.vault_file = os.path.join(root, "vault.json")
+        self.blobs = BlobStore(os.path.join(root, "blobs"))
+        self.items = create_item_store(root, self.blobs)
+        self.migrate_inline_files()
+        self.blobs.sweep()
+    
+    def load_item_content(self, item):
+        if item.get("blob"):
+            return base64.b64encode(self.blobs.read(item["blob"])).decode()
+        return item.get("content", "")
+    
+    def content_fields(self, item, content):
+        if item.get("type") != "file":
+            return {"content": content}
+        data = base64.b64decode(content)
+        return {"content": "", "blob": self.blobs.put(data), "size": len(data)}
+    
+    def encrypt_blob(self, digest, password, level, master_key=None):
+        writer = self.blobs.writer()
+        try:
+            with self.blobs.open(digest) as src:
+                EncryptionManager.encrypt_stream(src, writer, password, level, master_key=master_key)
+        except Exception:
+            writer.discard()
+            raise
+        return {"content": "", "blob": writer.commit(), "size": writer.size, "cipher": "stream"}
+    
+    def decrypt_blob(self, digest, password, master_key=None):
+        writer = self.blobs.writer()
+        try:
+            with self.blobs.open(digest) as src:
+                EncryptionManager.decrypt_stream(src, writer, password, master_key)
+        except Exception:
+            writer.discard()
+            raise
+        return {"content": "", "blob": writer.commit(), "size": writer.size, "cipher": ""}
+    
+    def kdf_salt(self):
+        with self.lock:
+            vault = {}
+            if os.path.exists(self.vault_file):
+                with open(self.vault_file, "r", encoding="utf-8") as f:
+                    vault = json.load(f)
+            if not vault.get("kdf_salt"):
+                vault["kdf_salt"] = secrets.token_hex(16)
+                write_file_atomic(self.vault_file, json.dumps(vault, indent=2).encode("utf-8"))
+            return bytes.fromhex(vault["kdf_salt"])
+    
+    def externalize_item(self, item):
+        if item.get("type") == "file" and item.get("content") and not item.get("blob"):
+            item.update(self.content_fields(item, item["content"]))
+        return item
+    
+    def content_prefix(self, item, length):
+        if not item.get("blob"):
+            return item.get("content", "")[:length]
+        with self.blobs.open(item["blob"]) as f:
+            return base64.b64encode(f.read(-(-length // 4) * 3)).decode()[:length]
+    
+    def inline_item(self, item):
+        if not item.get("blob"):
+            return item
+        inlined = {k: v for k, v in item.items() if k not in ("blob", "size")}
+        inlined["content"] = self.load_item_content(item)
+        return inlined
+    
+    def migrate_inline_files(self):
+        for item in self.items.all():
+            if item.get("type") == "file" and item.get("content") and not item.get("blob"):
+                self.items.update(item["id"], self.content_fields(item, item["content"]))
+
+    def close(self):
+        self.items.close()
+
+LEGACY_VAULT_FILES = (
+    (ITEMS_FILE, "items.json"),
+    (JOURNAL_FILE, "items.journal"),
+    (JOURNAL_FILE + ".old", "items.journal.old"),
+    (SQLITE_FILE, "items.db"),
+    (SQLITE_FILE + "-wal", "items.db-wal"),
+    (SQLITE_FILE + "-shm", "items.db-shm"),
+    (BLOB_DIR, "blobs"),
+    (VAULT_FILE, "vault.json"),
+)
+
+class VaultRegistry:
+    SAFE_NAME = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+    
+    def __init__(self, root, max_vaults=VAULT_CACHE_SIZE, idle_seconds=VAULT_IDLE_SECONDS):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_vaults = max_vaults
+        self.idle_seconds = idle_seconds
+        self.lock = threading.Lock()
+        self.file_lock = FileLock(os.path.join(root, ".lock"))
+        self.vaults = OrderedDict()
+        self.loading = {}
+    
+    def vault_dir(self, username):
+        if self.SAFE_NAME.match(username) and not username.startswith((".", "u-")):
+            return os.path.join(self.root, username)
+        return os.path.join(self.root, "u-" + hashlib.sha256(username.encode("utf-8")).hexdigest()[:32])
+    
+    def migrate_legacy(self, username, root):
+        if os.path.exists(root) or next(iter(user_directory.users), None) != username:
+            return
+        legacy = [(src, name) for src, name in LEGACY_VAULT_FILES if os.path.exists(src)]
+        if not legacy:
+            return
+        os.makedirs(root, exist_ok=True)
+        for src, name in legacy:
+            os.replace(src, os.path.join(root, name))
+    
+    def load(self, username):
+        root = self.vault_dir(username)
+        with self.file_lock:
+            self.migrate_legacy(username, root)
+        vault = Vault(root)
+        vault.username = username
+        vault.users = 0
+        return vault
+
+    def acquire(self, username):
+        # Vaults load outside the registry lock so a slow load only blocks requests for the same user.
+        while True:
+            with self.lock:
+                vault = self.vaults.get(username)
+                if vault is not None:
+                    self.vaults.move_to_end(username)
+                    vault.users += 1
+                    vault.last_used = time.monotonic()
+                    evicted = self.evict()
+                    break
+                loading = self.loading.get(username)
+                owner = loading is None
+                if owner:
+                    loading = self.loading[username] = Future()
+            if not owner:
+                loading.result()
+                continue
+            try:
+                vault = self.load(username)
+            except BaseException as e:
+                with self.lock:
+                    del self.loading[username]
+                loading.set_exception(e)
+                raise
+            with self.lock:
+                del self.loading[username]
+                self.vaults[username] = vault
+                vault.users += 1
+                vault.last_used = time.monotonic()
+                evicted = self.evict()
+            loading.set_result(vault)
+            break
+        for stale in evicted:
+            stale.close()
+        return vault
+
+    def release(self, vault):
+        with self.lock:
+            vault.users -= 1
+            vault.last_used = time.monotonic()
+            if self.vaults.get(vault.username) is vault:
+                self.vaults.move_to_end(vault.username)
+            evicted = self.evict()
+        for stale in evicted:
+            stale.close()
+
+    def evict(self):
+        # Vaults still serving a request are skipped; they get another chance when released.
+        now = time.monotonic()
+        evicted = []
+        for username, vault in list(self.vaults.items()):
+            if len(self.vaults) <= self.max_vaults and now - vault.last_used < self.idle_seconds:
+                break
+            if vault.users == 0:
+                evicted.append(self.vaults.pop(username))
+        return evicted
+
+vault_registry = VaultRegistry(VAULTS_DIR)
+
+def current_vault():
+    if "vault" not in g:
+        g.vault = vault_registry.acquire(session["username"])
+    return g.vault
+
+@app.teardown_request
+def release_vault(exc):
+    vault = g.pop("vault", None)
+    if vault is not None:
+        vault_registry.release(vault)
+
+def key_session_id():
+    if "key_session" not in session:
+        session["key_session"] = secrets.token_hex(16)
+    return session["key_session"]
+
+def vault_master_key(password, salt, level):
+    return key_cache.get_master_key(key_session_id(), password, salt, EncryptionManager.KDF_ITERATIONS[level])
+
+def crypto_task(op, content, password, level, master_key=None):
+    if op == "encrypt":
+        if master_key is not None:
+            return EncryptionManager.encrypt_vault(content, master_key, level)
+        return EncryptionManager.encrypt(content, password, level)
+    if master_key is not None:
+        return EncryptionManager.decrypt_vault(content, master_key, level)
+    return EncryptionManager.decrypt(content, password, level)
+
+def prepare_crypto(vault, op, item, password, level=None):
+    master_key = None
+    changes = {"kdf": "", "kdf_salt": ""}
+    if op == "encrypt":
+        if level in EncryptionManager.KDF_ITERATIONS:
+            salt = vault.kdf_salt()
+            master_key = vault_master_key(password, salt, level)
+            changes = {"kdf": "vault", "kdf_salt": salt.hex()}
+    else:
+        level = item["level"]
+        if item.get("kdf") == "vault":
+            master_key = vault_master_key(password, bytes.fromhex(item["kdf_salt"]), level)
+    return level, master_key, changes
+
+def blob_crypto_fields(vault, op, item, password, level, master_key):
+    if op == "encrypt" and item.get("blob"):
+        return vault.encrypt_blob(item["blob"], password, level, master_key)
+    if op == "decrypt" and item.get("cipher") == "stream":
+        return vault.decrypt_blob(item["blob"], password, master_key)
+    return None
+
+def crypto_state_fields(op, level):
+    if op == "encrypt":
+        return {"encrypted": True, "level": level, "modified": datetime.now().isoformat()}
+    return {"encrypted": False, "level": 0, "modified": datetime.now().isoformat()}
+
+def crypto_item_fields(vault, op, item, password, level=None):
+    level, master_key, changes = prepare_crypto(vault, op, item, password, level)
+    blob_changes = blob_crypto_fields(vault, op, item, password, level, master_key)
+    if blob_changes is None:
+        blob_changes = vault.content_fields(item, crypto_task(op, vault.load_item_content(item), password, level, master_key))
+    changes.update(blob_changes)
+    changes.update(crypto_state_fields(op, level))
+    return changes
+
+crypto_executor = None
+crypto_executor_lock = threading.Lock()
+
+def crypto_pool():
+    global crypto_executor
+    with crypto_executor_lock:
+        if crypto_executor is None:
+            # fork() only copies the calling thread, so the process pool is created while this process is still single-threaded
+            # (at startup or in gunicorn's post_fork); created any later, it falls back to threads.
+            if "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1:
+                crypto_executor = ProcessPoolExecutor(max_workers=CRYPTO_WORKERS, mp_context=multiprocessing.get_context("fork"))
+                crypto_executor.submit(int).result()
+            else:
+                crypto_executor = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS)
+            atexit.register(crypto_executor.shutdown, wait=False)
+        return crypto_executor
+
+def crypto_batch(vault, op, item_ids, password, level=None):
+    results = []
+    updates = []
+    pending = []
+    for item_id in item_ids:
+        result = {"item_id": item_id, "success": False}
+        results.append(result)
+        item = vault.items.get(item_id)
+        if item is None:
+            result["error"] = "Item no encontrado"
+            continue
+        try:
+            item_level, master_key, changes = prepare_crypto(vault, op, item, password, level)
+            blob_changes = blob_crypto_fields(vault, op, item, password, item_level, master_key)
+            if blob_changes is None:
+                future = crypto_pool().submit(crypto_task, op, vault.load_item_content(item), password, item_level, master_key)
+                pending.append((result, item, item_level, changes, future))
+                continue
+            changes.update(blob_changes)
+            changes.update(crypto_state_fields(op, item_level))
+            updates.append((item_id, changes))
+            result["success"] = True
+        except Exception as e:
+            result["error"] = str(e)
+    for result, item, item_level, changes, future in pending:
+        try:
+            changes.update(vault.content_fields(item, future.result()))
+            changes.update(crypto_state_fields(op, item_level))
+            updates.append((item["id"], changes))
+            result["success"] = True
+        except Exception as e:
+            result["error"] = str(e)
+    if updates:
+        vault.items.update_many(updates)
+    return results
+
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/plain", "text/csv", "text/css", "application/javascript")
+PAGE_TEMPLATES = ("index.html", "login.html", "register.html", "installer.html")
+static_pages = {}
+
+def negotiate_encoding():
+    accepted = request.accept_encodings
+    encodings = [e for e in (("br", "gzip") if brotli is not None else ("gzip",)) if accepted[e]]
+    return max(encodings, key=lambda e: accepted[e]) if encodings else None
+
+def compress_body(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=min(COMPRESSION_LEVEL, 11))
+    return gzip.compress(data, compresslevel=COMPRESSION_LEVEL, mtime=0)
+
+def load_static_pages():
+    with app.app_context():
+        for name in PAGE_TEMPLATES:
+            body = render_template(name).encode("utf-8")
+            variants = {"identity": body, "gzip": compress_body(body, "gzip")}
+            if brotli is not None:
+                variants["br"] = compress_body(body, "br")
+            static_pages[name] = (variants, hashlib.sha256(body).hexdigest()[:32])
+
+def page_response(name):
+    variants, etag = static_pages[name]
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    encoding = negotiate_encoding() if len(variants["identity"]) >= COMPRESSION_MIN_SIZE else None
+    response = app.response_class(variants[encoding or "identity"], mimetype="text/html")
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+        etag = f"{etag}-{encoding}"
+    return with_etag(response, etag)
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    encoding = negotiate_encoding() if len(data) >= COMPRESSION_MIN_SIZE else None
+    if encoding is None:
+        return response
+    response.set_data(compress_body(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+load_static_pages()
+
 @app.route('/')
 def index():
     if not is_logged_in():
         return redirect(url_for('login'))
-    return render_template('index.html')
+    return page_response('index.html')
 
 @app.route('/login')
 def login():
     if is_logged_in():
         return redirect(url_for('index'))
-    return render_template('login.html')
+    return page_response('login.html')
 
 @app.route('/register')
 def register():
     if is_logged_in():
         return redirect(url_for('index'))
-    return render_template('register.html')
+    return page_response('register.html')
 
 @app.route('/api/version', methods=['GET'])
 def get_version():
@@ -311,16 +2774,22 @@ def api_register():
     if len(password) < 8:
         return jsonify({"success": False, "error": "La contraseña debe tener al menos 8 caracteres"}), 400
     
-    users = load_users()
-    if username in users:
+    if user_directory.get(username) is not None:
         return jsonify({"success": False, "error": "El usuario ya existe"}), 400
     
-    users[username] = {
-        "password": hash_password(password),
+    try:
+        password_hash = auth_pool.run(hash_password, password)
+    except AuthPoolBusy:
+        return auth_busy_response()
+    
+    created = user_directory.add(username, {
+        "password": password_hash,
         "created": datetime.now().isoformat()
-    }
-    save_users(users)
+    })
+    if not created:
+        return jsonify({"success": False, "error": "El usuario ya existe"}), 400
     
+    key_cache.clear(session.pop("key_session", None))
     session['logged_in'] = True
     session['username'] = username
     
@@ -335,13 +2804,18 @@ def api_login():
     if not username or not password:
         return jsonify({"success": False, "error": "Usuario y contraseña requeridos"}), 400
     
-    users = load_users()
-    if username not in users:
+    user = user_directory.get(username)
+    if user is None:
         return jsonify({"success": False, "error": "Usuario o contraseña incorrectos"}), 401
     
-    if not verify_password(users[username]["password"], password):
+    try:
+        valid = auth_pool.run(verify_password, user["password"], password)
+    except AuthPoolBusy:
+        return auth_busy_response()
+    if not valid:
         return jsonify({"success": False, "error": "Usuario o contraseña incorrectos"}), 401
     
+    key_cache.clear(session.pop("key_session", None))
     session['logged_in'] = True
     session['username'] = username
     
@@ -349,6 +2823,7 @@ def api_login():
 
 @app.route('/api/auth/logout', methods=['POST'])
 def api_logout():
+    key_cache.clear(session.get("key_session"))
     session.clear()
     return jsonify({"success": True})
 
@@ -384,96 +2859,278 @@ def api_check_password():
     strength = check_password_strength(password)
     return jsonify({"success": True, "strength": strength})
 
+ITEM_SORT_FIELDS = ("created", "modified", "name")
+MAX_PAGE_SIZE = 1000
+PREVIEW_LENGTH = 100
+SUGGEST_LIMIT = 8
+MAX_SUGGEST_LIMIT = 50
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+def sort_key(item, sort):
+    value = str(item.get(sort) or "")
+    if sort == "name":
+        value = value.lower()
+    return (value, item["id"])
+
+def paginate_items(items, sort, order, limit, cursor):
+    reverse = order == "desc"
+    if sort:
+        page_key = lambda item: list(sort_key(item, sort))
+    else:
+        page_key = lambda item: item["seq"]
+    if sort or limit or cursor:
+        # Pages resume after a key rather than an offset, so unsorted pages follow insertion order even for ranked searches.
+        items = sorted(items, key=page_key, reverse=reverse)
+    elif reverse:
+        items = items[::-1]
+    
+    start = 0
+    if cursor:
+        key = decode_cursor(cursor)["key"]
+        start = next((i for i, item in enumerate(items) if (page_key(item) < key if reverse else page_key(item) > key)), len(items))
+    
+    end = start + limit if limit else len(items)
+    page = items[start:end]
+    next_cursor = None
+    if page and end < len(items):
+        next_cursor = encode_cursor({"key": page_key(page[-1])})
+    return page, next_cursor, len(items)
+
+def paginate_store(store, order, limit, cursor):
+    # An unfiltered, unsorted page only needs the next `limit` rows, which SQLite reads without loading the rest.
+    after = decode_cursor(cursor)["key"] if cursor else None
+    if after is not None and not isinstance(after, int):
+        raise ValueError(after)
+    page = store.page_after(after, limit + 1, order == "desc")
+    next_cursor = encode_cursor({"key": page[limit - 1]["seq"]}) if len(page) > limit else None
+    return page[:limit], next_cursor, store.count()
+
+def item_preview(item):
+    content = item.get("content", "")
+    if item.get("type") == "file" or not isinstance(content, str):
+        return ""
+    return content[:PREVIEW_LENGTH + 1]
+
+def project_item(item, fields):
+    projected = {"id": item["id"]}
+    for field in fields:
+        if field == "preview":
+            projected["preview"] = item_preview(item)
+        elif field in item:
+            projected[field] = item[field]
+    return projected
+
+def revision_etag(vault, revision):
+    return hashlib.sha256(f"{vault.root}:{revision}:{request.full_path}".encode()).hexdigest()[:32]
+
+def item_etag(item):
+    return hashlib.sha256(json.dumps(item, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:32]
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def not_modified(etag):
+    for candidate in (etag, f"{etag}-gzip", f"{etag}-br"):
+        if request.if_none_match.contains_weak(candidate):
+            return with_etag(app.response_class(status=304), candidate)
+    return None
+
+def item_filters():
+    filters = {}
+    if request.args.get("category"):
+        filters["category"] = request.args["category"]
+    if request.args.get("type"):
+        filters["item_type"] = request.args["type"]
+    if request.args.get("encrypted_only", "false") == "true":
+        filters["encrypted_only"] = True
+    if request.args.get("level"):
+        filters["level"] = int(request.args["level"])
+    tags = [tag.strip() for tag in request.args.get("tags", "").split(",") if tag.strip()]
+    if tags:
+        filters["tags"] = tags
+        filters["tags_mode"] = request.args.get("tags_mode", "and")
+        if filters["tags_mode"] not in ("and", "or"):
+            raise ValueError(filters["tags_mode"])
+    return filters
+
 @app.route('/api/items', methods=['GET'])
 def get_items():
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
+    vault = current_vault()
+    etag = revision_etag(vault, vault.items.current_revision())
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    
     search = request.args.get("search", "").lower()
-    category = request.args.get("category", "")
-    item_type = request.args.get("type", "")
-    encrypted_only = request.args.get("encrypted_only", "false") == "true"
-    
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
-    
-    filtered_items = items
-    if search:
-        filtered_items = [item for item in filtered_items if search in item.get("name", "").lower() or search in item.get("content", "").lower()]
-    if category:
-        filtered_items = [item for item in filtered_items if item.get("category", "") == category]
-    if item_type:
-        filtered_items = [item for item in filtered_items if item.get("type", "") == item_type]
-    if encrypted_only:
-        filtered_items = [item for item in filtered_items if item.get("encrypted", False)]
-    
-    return jsonify(filtered_items)
+    sort = request.args.get("sort", "")
+    order = request.args.get("order", "asc")
+    cursor = request.args.get("cursor", "")
+    fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+    
+    try:
+        limit = int(request.args.get("limit", 0))
+        if sort and sort not in ITEM_SORT_FIELDS or order not in ("asc", "desc") or limit < 0:
+            raise ValueError(sort)
+        limit = min(limit, MAX_PAGE_SIZE)
+        filters = item_filters()
+        if limit and not search and not sort and not filters:
+            page, next_cursor, total = paginate_store(vault.items, order, limit, cursor)
+        else:
+            filtered_items = vault.items.query(search, **filters)
+            page, next_cursor, total = paginate_items(filtered_items, sort, order, limit, cursor)
+    except (ValueError, TypeError, KeyError):
+        return jsonify({"error": "Parámetros de paginación no válidos"}), 400
+    
+    if fields:
+        page = [project_item(item, fields) for item in page]
+    
+    response = jsonify(page)
+    response.headers["X-Total-Count"] = str(total)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return with_etag(response, etag)
+
+@app.route('/api/items/count', methods=['GET'])
+def count_items():
+    if not is_logged_in():
+        return jsonify({"error": "No autorizado"}), 401
+    
+    vault = current_vault()
+    etag = revision_etag(vault, vault.items.current_revision())
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    
+    try:
+        count = vault.items.count(**item_filters())
+    except ValueError:
+        return jsonify({"error": "Filtros no válidos"}), 400
+    
+    return with_etag(jsonify({"count": count}), etag)
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
-    
-    stats = {
-        "total_items": len(items),
-        "encrypted_items": len([i for i in items if i.get("encrypted", False)]),
-        "text_items": len([i for i in items if i.get("type") == "text"]),
-        "password_items": len([i for i in items if i.get("type") == "password"]),
-        "file_items": len([i for i in items if i.get("type") == "file"]),
-        "note_items": len([i for i in items if i.get("type") == "note"]),
-        "by_level": {
-            "1": len([i for i in items if i.get("level") == 1]),
-            "2": len([i for i in items if i.get("level") == 2]),
-            "3": len([i for i in items if i.get("level") == 3]),
-            "4": len([i for i in items if i.get("level") == 4]),
-            "5": len([i for i in items if i.get("level") == 5])
-        },
-        "categories": {}
-    }
+    vault = current_vault()
+    etag = revision_etag(vault, vault.items.current_revision())
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
     
-    for item in items:
-        cat = item.get("category", "Sin categoría")
-        stats["categories"][cat] = stats["categories"].get(cat, 0) + 1
-    
-    return jsonify(stats)
+    return with_etag(jsonify(vault.items.stats()), etag)
 
 @app.route('/api/categories', methods=['GET'])
 def get_categories():
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
+    vault = current_vault()
+    etag = revision_etag(vault, vault.items.current_revision())
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
     
-    categories = set()
-    for item in items:
-        cat = item.get("category", "")
-        if cat:
-            categories.add(cat)
+    return with_etag(jsonify(vault.items.categories()), etag)
+
+EVENT_HEARTBEAT_SECONDS = 15
+
+def sse_message(event):
+    return f"id: {event['rev']}\ndata: {json.dumps(event, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+event_stream_slots = threading.BoundedSemaphore(EVENT_STREAMS)
+
+def pending_events(store, revision):
+    events = store.events_since(revision)
+    if events is None:
+        return [{"rev": store.current_revision(), "op": "reset"}]
+    return events
+
+def event_stream(store, revision):
+    if not event_stream_slots.acquire(blocking=False):
+        # Each open stream pins a server thread; past the cap, flush what is pending and let the client poll again later.
+        yield f"retry: {int(EVENT_BUSY_RETRY * 1000)}\n\n"
+        yield "".join(sse_message(event) for event in pending_events(store, revision))
+        return
+    try:
+        deadline = time.monotonic() + EVENT_STREAM_SECONDS
+        last_sent = time.monotonic()
+        yield f"retry: {int(EVENT_POLL_INTERVAL * 1000)}\n\n"
+        while time.monotonic() < deadline:
+            events = pending_events(store, revision)
+            if events:
+                revision = events[-1]["rev"]
+                last_sent = time.monotonic()
+                yield "".join(sse_message(event) for event in events)
+            elif time.monotonic() - last_sent >= EVENT_HEARTBEAT_SECONDS:
+                last_sent = time.monotonic()
+                yield ": ping\n\n"
+            store.wait_events(revision, EVENT_POLL_INTERVAL)
+    finally:
+        event_stream_slots.release()
+
+@app.route('/api/events', methods=['GET'])
+def item_events():
+    if not is_logged_in():
+        return jsonify({"error": "No autorizado"}), 401
     
-    return jsonify(list(categories))
+    vault = current_vault()
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("since", "")
+    try:
+        revision = int(last_event_id) if last_event_id else vault.items.current_revision()
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID no válido"}), 400
+    
+    response = Response(stream_with_context(event_stream(vault.items, revision)), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route('/api/items/suggest', methods=['GET'])
+def suggest_items():
+    if not is_logged_in():
+        return jsonify({"error": "No autorizado"}), 401
+    
+    vault = current_vault()
+    etag = revision_etag(vault, vault.items.current_revision())
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    
+    try:
+        limit = int(request.args.get("limit", SUGGEST_LIMIT))
+        if limit < 1:
+            raise ValueError(limit)
+    except ValueError:
+        return jsonify({"error": "Límite de sugerencias no válido"}), 400
+    
+    suggestions = vault.items.suggest(request.args.get("q", ""), min(limit, MAX_SUGGEST_LIMIT))
+    return with_etag(jsonify(suggestions), etag)
 
 @app.route('/api/items', methods=['POST'])
 def add_item():
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
-    data = request.json
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
+    vault = current_vault()
+    item = new_item(request.json)
+    vault.items.add(item)
     
-    item = {
+    return jsonify({"success": True, "item": item})
+
+def new_item(data):
+    return {
         "id": secrets.token_hex(16),
         "name": data.get("name", ""),
         "type": data.get("type", "text"),
@@ -485,32 +3142,72 @@ def add_item():
         "created": datetime.now().isoformat(),
         "modified": datetime.now().isoformat()
     }
-    items.append(item)
-    
-    with open(f"{DATA_DIR}/items.json", "w", encoding="utf-8") as f:
-        json.dump(items, f, indent=2, ensure_ascii=False)
+
+def client_item_fields(data):
+    return {k: v for k, v in data.items() if k not in SERVER_ITEM_FIELDS}
+
+def batch_operation(operation):
+    if not isinstance(operation, dict) or operation.get("op") not in ("add", "update", "delete"):
+        raise ValueError("Operación no válida")
+    op = operation["op"]
+    data = operation.get("data", {})
+    if op != "add" and not isinstance(operation.get("id"), str):
+        raise ValueError("ID de item requerido")
+    if op != "delete" and not isinstance(data, dict):
+        raise ValueError("Datos no válidos")
+    if op == "add":
+        return ("add", new_item(data))
+    if op == "update":
+        return ("update", operation["id"], dict(client_item_fields(data), modified=datetime.now().isoformat()))
+    return ("delete", operation["id"])
+
+@app.route('/api/items/batch', methods=['POST'])
+def batch_items():
+    if not is_logged_in():
+        return jsonify({"error": "No autorizado"}), 401
     
-    return jsonify({"success": True, "item": item})
+    operations = (request.json or {}).get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"success": False, "error": "Lista de operaciones requerida"}), 400
+    if len(operations) > MAX_BATCH_SIZE:
+        return jsonify({"success": False, "error": "Demasiadas operaciones en el lote"}), 400
+    
+    parsed = []
+    errors = {}
+    for index, operation in enumerate(operations):
+        try:
+            parsed.append(batch_operation(operation))
+        except ValueError as e:
+            errors[index] = str(e)
+    if not errors:
+        items, missing = current_vault().items.apply_batch(parsed)
+        errors = {index: "Item no encontrado" for index in missing}
+    
+    results = []
+    for index, operation in enumerate(operations):
+        result = {"index": index, "op": operation.get("op") if isinstance(operation, dict) else None}
+        if errors:
+            result["success"] = False
+            result["valid"] = index not in errors
+            if index in errors:
+                result["error"] = errors[index]
+        else:
+            result["success"] = True
+            result["id"] = items[index]["id"]
+        results.append(result)
+    if errors:
+        return jsonify({"success": False, "error": "Lote no válido; no se aplicó ninguna operación", "results": results}), 400
+    return jsonify({"success": True, "results": results})
 
 @app.route('/api/items/<item_id>', methods=['PUT'])
 def update_item(item_id):
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
-    data = request.json
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
-    
-    for item in items:
-        if item["id"] == item_id:
-            data["modified"] = datetime.now().isoformat()
-            item.update(data)
-            break
-    
-    with open(f"{DATA_DIR}/items.json", "w", encoding="utf-8") as f:
-        json.dump(items, f, indent=2, ensure_ascii=False)
+    vault = current_vault()
+    data = client_item_fields(request.json)
+    data["modified"] = datetime.now().isoformat()
+    vault.items.update(item_id, data)
     
     return jsonify({"success": True})
 
@@ -519,14 +3216,14 @@ def get_item(item_id):
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
-    
-    for item in items:
-        if item["id"] == item_id:
-            return jsonify(item)
+    vault = current_vault()
+    item = vault.items.get(item_id)
+    if item is not None:
+        etag = item_etag(item)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        return with_etag(jsonify(item), etag)
     
     return jsonify({"error": "Item no encontrado"}), 404
 
@@ -535,15 +3232,8 @@ def delete_item(item_id):
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
-    
-    items = [item for item in items if item["id"] != item_id]
-    
-    with open(f"{DATA_DIR}/items.json", "w", encoding="utf-8") as f:
-        json.dump(items, f, indent=2, ensure_ascii=False)
+    vault = current_vault()
+    vault.items.delete(item_id)
     
     return jsonify({"success": True})
 
@@ -552,30 +3242,19 @@ def encrypt_item():
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
+    vault = current_vault()
     data = request.json
     item_id = data.get("item_id")
     password = data.get("password")
     level = int(data.get("level", 1))
     
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
-    
-    for item in items:
-        if item["id"] == item_id:
-            try:
-                encrypted_content = EncryptionManager.encrypt(item["content"], password, level)
-                item["content"] = encrypted_content
-                item["encrypted"] = True
-                item["level"] = level
-                item["modified"] = datetime.now().isoformat()
-                break
-            except Exception as e:
-                return jsonify({"success": False, "error": str(e)}), 400
-    
-    with open(f"{DATA_DIR}/items.json", "w", encoding="utf-8") as f:
-        json.dump(items, f, indent=2, ensure_ascii=False)
+    item = vault.items.get(item_id)
+    if item is not None:
+        try:
+            changes = crypto_item_fields(vault, "encrypt", item, password, level)
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        vault.items.update(item_id, changes)
     
     return jsonify({"success": True})
 
@@ -584,139 +3263,327 @@ def decrypt_item():
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
+    vault = current_vault()
     data = request.json
     item_id = data.get("item_id")
     password = data.get("password")
     
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
+    item = vault.items.get(item_id)
+    if item is not None:
+        try:
+            changes = crypto_item_fields(vault, "decrypt", item, password)
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        vault.items.update(item_id, changes)
     
-    for item in items:
-        if item["id"] == item_id:
-            try:
-                decrypted_content = EncryptionManager.decrypt(item["content"], password, item["level"])
-                item["content"] = decrypted_content
-                item["encrypted"] = False
-                item["level"] = 0
-                item["modified"] = datetime.now().isoformat()
-                break
-            except Exception as e:
-                return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True})
+
+def crypto_batch_response(op, data, level=None):
+    item_ids = data.get("item_ids")
+    if not isinstance(item_ids, list) or not item_ids:
+        return jsonify({"success": False, "error": "Lista de items requerida"}), 400
+    if len(item_ids) > MAX_BATCH_SIZE:
+        return jsonify({"success": False, "error": "Demasiados items en el lote"}), 400
+    
+    results = crypto_batch(current_vault(), op, item_ids, data.get("password"), level)
+    succeeded = len([r for r in results if r["success"]])
+    return jsonify({
+        "success": True,
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded
+    })
+
+@app.route('/api/encrypt/batch', methods=['POST'])
+def encrypt_batch():
+    if not is_logged_in():
+        return jsonify({"error": "No autorizado"}), 401
     
-    with open(f"{DATA_DIR}/items.json", "w", encoding="utf-8") as f:
-        json.dump(items, f, indent=2, ensure_ascii=False)
+    data = request.json or {}
+    return crypto_batch_response("encrypt", data, int(data.get("level", 1)))
+
+@app.route('/api/decrypt/batch', methods=['POST'])
+def decrypt_batch():
+    if not is_logged_in():
+        return jsonify({"error": "No autorizado"}), 401
     
-    return jsonify({"success": True})
+    return crypto_batch_response("decrypt", request.json or {})
+
+def buffered_chunks(parts, size=STREAM_CHUNK_SIZE):
+    buffer = []
+    length = 0
+    started = False
+    for part in parts:
+        data = part.encode("utf-8")
+        buffer.append(data)
+        length += len(data)
+        if length >= size or not started:
+            yield b"".join(buffer)
+            buffer = []
+            length = 0
+            started = True
+    if buffer:
+        yield b"".join(buffer)
+
+def export_json_parts(items):
+    yield '{\n  "items": ['
+    empty = True
+    for item in items:
+        yield ("\n" if empty else ",\n") + textwrap.indent(json.dumps(item, indent=2, ensure_ascii=False), "    ")
+        empty = False
+    yield "]" if empty else "\n  ]"
+    yield f',\n  "version": {json.dumps(get_current_version())}'
+    yield f',\n  "exported_at": {json.dumps(datetime.now().isoformat())}\n}}'
+
+def export_csv_parts(items):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["ID", "Nombre", "Tipo", "Categoría", "Encriptado", "Nivel", "Creado", "Modificado"])
+    for item in items:
+        writer.writerow([
+            item.get("id", ""),
+            item.get("name", ""),
+            item.get("type", ""),
+            item.get("category", ""),
+            "Sí" if item.get("encrypted", False) else "No",
+            item.get("level", 0),
+            item.get("created", ""),
+            item.get("modified", "")
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def export_txt_parts(vault, items):
+    yield f"SecureVault Export - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+    yield "=" * 60 + "\n\n"
+    for item in items:
+        lines = [
+            f"Nombre: {item.get('name', '')}\n",
+            f"Tipo: {item.get('type', '')}\n",
+            f"Categoría: {item.get('category', 'N/A')}\n",
+            f"Encriptado: {'Sí' if item.get('encrypted', False) else 'No'}\n"
+        ]
+        if item.get('encrypted'):
+            lines.append(f"Nivel: {item.get('level', 0)}\n")
+        lines.append(f"Contenido: {vault.content_prefix(item, 100)}...\n")
+        lines.append("-" * 60 + "\n\n")
+        yield "".join(lines)
+
+def export_response(chunks, download_name, mimetype):
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={download_name}"
+    return response
 
 @app.route('/api/export', methods=['POST'])
 def export_data():
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
+    vault = current_vault()
     data = request.json
     password = data.get("password")
     level = int(data.get("level", 5))
     format_type = data.get("format", "encript")
     
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
+    items = vault.items.iter_items()
     
     if format_type == "encript":
-        export_data = {
-            "items": items,
-            "version": get_current_version(),
-            "exported_at": datetime.now().isoformat()
-        }
-        json_str = json.dumps(export_data, indent=2, ensure_ascii=False)
-        encrypted = EncryptionManager.encrypt(json_str, password, level)
-        filename = f"{ENCRYPTED_DIR}/export_{secrets.token_hex(8)}.encript"
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(encrypted)
-        return send_file(filename, as_attachment=True, download_name="database.encript")
+        if not password or level not in range(1, 6):
+            return jsonify({"error": "Contraseña o nivel de encriptación no válidos"}), 400
+        parts = export_json_parts(vault.inline_item(item) for item in items)
+        chunks = EncryptionManager.container_frames(buffered_chunks(parts), password, level)
+        return export_response(chunks, "database.encript", "application/octet-stream")
     elif format_type == "json":
-        export_data = {
-            "items": items,
-            "version": get_current_version(),
-            "exported_at": datetime.now().isoformat()
-        }
-        filename = f"{ENCRYPTED_DIR}/export_{secrets.token_hex(8)}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(export_data, f, indent=2, ensure_ascii=False)
-        return send_file(filename, as_attachment=True, download_name="database.json")
+        parts = export_json_parts(vault.inline_item(item) for item in items)
+        return export_response(buffered_chunks(parts), "database.json", "application/json")
     elif format_type == "csv":
-        import csv
-        filename = f"{ENCRYPTED_DIR}/export_{secrets.token_hex(8)}.csv"
-        with open(filename, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["ID", "Nombre", "Tipo", "Categoría", "Encriptado", "Nivel", "Creado", "Modificado"])
-            for item in items:
-                writer.writerow([
-                    item.get("id", ""),
-                    item.get("name", ""),
-                    item.get("type", ""),
-                    item.get("category", ""),
-                    "Sí" if item.get("encrypted", False) else "No",
-                    item.get("level", 0),
-                    item.get("created", ""),
-                    item.get("modified", "")
-                ])
-        return send_file(filename, as_attachment=True, download_name="database.csv")
+        return export_response(buffered_chunks(export_csv_parts(items)), "database.csv", "text/csv")
     elif format_type == "txt":
-        filename = f"{ENCRYPTED_DIR}/export_{secrets.token_hex(8)}.txt"
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(f"SecureVault Export - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("=" * 60 + "\n\n")
-            for item in items:
-                f.write(f"Nombre: {item.get('name', '')}\n")
-                f.write(f"Tipo: {item.get('type', '')}\n")
-                f.write(f"Categoría: {item.get('category', 'N/A')}\n")
-                f.write(f"Encriptado: {'Sí' if item.get('encrypted', False) else 'No'}\n")
-                if item.get('encrypted'):
-                    f.write(f"Nivel: {item.get('level', 0)}\n")
-                f.write(f"Contenido: {item.get('content', '')[:100]}...\n")
-                f.write("-" * 60 + "\n\n")
-        return send_file(filename, as_attachment=True, download_name="database.txt")
+        return export_response(buffered_chunks(export_txt_parts(vault, items)), "database.txt", "text/plain")
     
     return jsonify({"error": "Formato no válido"}), 400
 
+class JsonItemReader:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size):
+        parts = [self.buffer[self.pos:]]
+        length = len(parts[0])
+        target = length + size
+        while length < target and not self.eof:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+                chunk = b""
+            part = self.text.decode(chunk, final=self.eof)
+            parts.append(part)
+            length += len(part)
+        self.buffer = "".join(parts)
+        self.pos = 0
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n\ufeff":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                return ""
+            self.fill(STREAM_CHUNK_SIZE)
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("JSON no válido")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        size = STREAM_CHUNK_SIZE
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill(size)
+            size *= 2
+
+    def items(self):
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            if key == "items":
+                self.expect("[")
+                if self.peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self.value()
+                        if self.peek() != ",":
+                            break
+                        self.pos += 1
+                    self.expect("]")
+            else:
+                self.value()
+            if self.peek() != ",":
+                break
+            self.pos += 1
+        self.expect("}")
+
+def import_candidates(vault, items, counts, staged):
+    for item in items:
+        if not isinstance(item, dict):
+            counts["skipped"] += 1
+            continue
+        if item.get("blob") and not vault.blobs.exists(item["blob"]):
+            counts["skipped"] += 1
+            continue
+        if not item.get("id"):
+            item["id"] = secrets.token_hex(16)
+        item = vault.externalize_item(item)
+        if item.get("blob"):
+            staged.add(item["blob"])
+        yield item
+
+def merge_batch(vault, batch, counts):
+    inserted, updated, skipped = vault.items.upsert_many(batch)
+    counts["inserted"] += inserted
+    counts["updated"] += updated
+    counts["skipped"] += skipped
+
+def import_items_response(vault, items, mode):
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    staged = set()
+    candidates = import_candidates(vault, items, counts, staged)
+    try:
+        if mode == "replace":
+            counts["inserted"] = vault.items.replace_all(candidates)
+        else:
+            batch = []
+            try:
+                for item in candidates:
+                    batch.append(item)
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        merge_batch(vault, batch, counts)
+                        batch = []
+            except Exception as e:
+                if not counts["inserted"] and not counts["updated"]:
+                    raise
+                # Earlier batches are already committed, so report them instead of a bare error.
+                return jsonify({
+                    "success": False,
+                    "error": f"Importación interrumpida: {e}",
+                    "partial": True,
+                    "mode": mode,
+                    "count": counts["inserted"] + counts["updated"],
+                    **counts
+                }), 400
+            if batch:
+                merge_batch(vault, batch, counts)
+    finally:
+        # Blobs of items that never committed are not referenced by anything.
+        vault.blobs.forget(staged)
+    return jsonify({
+        "success": True,
+        "mode": mode,
+        "count": counts["inserted"] + counts["updated"],
+        **counts
+    })
+
 @app.route('/api/import', methods=['POST'])
 def import_data():
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
+    vault = current_vault()
     if 'file' not in request.files:
         return jsonify({"success": False, "error": "No file provided"}), 400
     
     file = request.files['file']
     password = request.form.get("password")
+    mode = request.form.get("mode", "replace")
     
     if file.filename == '':
         return jsonify({"success": False, "error": "No file selected"}), 400
     
+    if mode not in ("merge", "replace"):
+        return jsonify({"success": False, "error": "Modo de importación no válido"}), 400
+    
     try:
         if file.filename.endswith('.encript'):
-            encrypted_content = file.read().decode('utf-8')
+            magic = file.stream.read(len(EncryptionManager.CONTAINER_MAGIC))
+            if magic == EncryptionManager.CONTAINER_MAGIC:
+                file.stream.seek(0)
+                chunks = EncryptionManager.container_chunks(file.stream, password)
+                try:
+                    return import_items_response(vault, JsonItemReader(chunks).items(), mode)
+                except ValueError:
+                    return jsonify({"success": False, "error": "Invalid password or file format"}), 400
+            encrypted_content = (magic + file.stream.read()).decode('utf-8')
             for level in range(5, 0, -1):
                 try:
-                    decrypted = EncryptionManager.decrypt(encrypted_content, password, level)
-                    import_data = json.loads(decrypted)
-                    items = import_data.get("items", [])
-                    with open(f"{DATA_DIR}/items.json", "w", encoding="utf-8") as f:
-                        json.dump(items, f, indent=2, ensure_ascii=False)
-                    return jsonify({"success": True, "count": len(items)})
+                    import_data = json.loads(EncryptionManager.decrypt(encrypted_content, password, level))
                 except:
                     continue
+                return import_items_response(vault, import_data.get("items", []), mode)
             return jsonify({"success": False, "error": "Invalid password or file format"}), 400
         elif file.filename.endswith('.json'):
-            import_data = json.loads(file.read().decode('utf-8'))
-            items = import_data.get("items", [])
-            with open(f"{DATA_DIR}/items.json", "w", encoding="utf-8") as f:
-                json.dump(items, f, indent=2, ensure_ascii=False)
-            return jsonify({"success": True, "count": len(items)})
+            chunks = iter(lambda: file.stream.read(STREAM_CHUNK_SIZE), b"")
+            return import_items_response(vault, JsonItemReader(chunks).items(), mode)
         else:
             return jsonify({"success": False, "error": "Formato de archivo no soportado"}), 400
     except Exception as e:
@@ -727,6 +3594,7 @@ def upload_file():
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
+    vault = current_vault()
     if 'file' not in request.files:
         return jsonify({"success": False, "error": "No file provided"}), 400
     
@@ -734,19 +3602,15 @@ def upload_file():
     if file.filename == '':
         return jsonify({"success": False, "error": "No file selected"}), 400
     
-    file_content = file.read()
-    file_b64 = base64.b64encode(file_content).decode()
-    
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
+    blob, size = vault.blobs.put_stream(file.stream)
     
     item = {
         "id": secrets.token_hex(16),
         "name": file.filename,
         "type": "file",
-        "content": file_b64,
+        "content": "",
+        "blob": blob,
+        "size": size,
         "category": request.form.get("category", ""),
         "tags": [],
         "encrypted": False,
@@ -754,10 +3618,7 @@ def upload_file():
         "created": datetime.now().isoformat(),
         "modified": datetime.now().isoformat()
     }
-    items.append(item)
-    
-    with open(f"{DATA_DIR}/items.json", "w", encoding="utf-8") as f:
-        json.dump(items, f, indent=2, ensure_ascii=False)
+    vault.items.add(item)
     
     return jsonify({"success": True, "item": item})
 
@@ -766,27 +3627,25 @@ def download_file(item_id):
     if not is_logged_in():
         return jsonify({"error": "No autorizado"}), 401
     
-    items = []
-    if os.path.exists(f"{DATA_DIR}/items.json"):
-        with open(f"{DATA_DIR}/items.json", "r", encoding="utf-8") as f:
-            items = json.load(f)
-    
-    for item in items:
-        if item["id"] == item_id:
-            file_content = base64.b64decode(item["content"])
-            filename = item["name"]
-            
-            temp_file = f"{ENCRYPTED_DIR}/temp_{secrets.token_hex(8)}"
-            with open(temp_file, "wb") as f:
-                f.write(file_content)
-            
-            return send_file(temp_file, as_attachment=True, download_name=filename)
+    vault = current_vault()
+    item = vault.items.get(item_id)
+    if item is not None:
+        filename = item["name"]
+        if item.get("blob"):
+            if not vault.blobs.exists(item["blob"]):
+                return jsonify({"success": False, "error": "File not found"}), 404
+            blob_path = os.path.abspath(vault.blobs.path(item["blob"]))
+            return send_file(blob_path, as_attachment=True, download_name=filename, etag=item["blob"], conditional=True)
+        
+        file_content = base64.b64decode(item["content"])
+        etag = hashlib.sha256(file_content).hexdigest()
+        return send_file(io.BytesIO(file_content), as_attachment=True, download_name=filename, etag=etag, conditional=True)
     
     return jsonify({"success": False, "error": "File not found"}), 404
 
 @app.route('/installer')
 def installer():
-    return render_template('installer.html')
+    return page_response('installer.html')
 
 @app.route('/api/install-path', methods=['GET'])
 def get_install_path():
@@ -832,6 +3691,28 @@ def install():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def serve_production(host, port, workers, threads):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("⚠ gunicorn no está instalado; usando el servidor integrado con hilos en un solo proceso.")
+        crypto_pool()
+        app.run(debug=False, host=host, port=port, threaded=True, use_reloader=False)
+        return
+    
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("post_fork", lambda server, worker: crypto_pool())
+        
+        def load(self):
+            return app
+    
+    print(f"Servidor de producción en http://{host}:{port} con {workers} procesos")
+    ProductionServer().run()
+
 if __name__ == '__main__':
     config_file = Path("config.json")
     is_first_run = not config_file.exists()
@@ -848,5 +3729,9 @@ if __name__ == '__main__':
         print(f"⚠ Actualización disponible: v{update_info['latest']}")
         print(f"  Versión actual: v{update_info['current']}\n")
     
-    app.run(debug=False, host='127.0.0.1', port=5000, use_reloader=False)
+    if SERVER_MODE == "production":
+        serve_production(SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_THREADS)
+    else:
+        crypto_pool()
+        app.run(debug=False, host=SERVER_HOST, port=SERVER_PORT, use_reloader=False)
 
@@ -0,0 +1,21 @@
+import os
+import secrets
+import sys
+import tempfile
+
+import pytest
+
+# app.py keeps its data, settings and secret key relative to the working directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="securevault-tests-"))
+
+
+@pytest.fixture
+def client():
+    import app
+
+    test_client = app.app.test_client()
+    with test_client.session_transaction() as session:
+        session["logged_in"] = True
+        session["username"] = "test-" + secrets.token_hex(8)
+    return test_client
@@ -0,0 +1,55 @@
+import app
+
+
+def batch(client, *operations):
+    return client.post("/api/items/batch", json={"operations": list(operations)})
+
+
+def names(client):
+    return [item["name"] for item in client.get("/api/items").get_json()]
+
+
+def test_batch_applies_every_operation(client):
+    first = client.post("/api/items", json={"name": "uno"}).get_json()["item"]
+    second = client.post("/api/items", json={"name": "dos"}).get_json()["item"]
+
+    response = batch(
+        client,
+        {"op": "add", "data": {"name": "tres", "tags": ["nuevo"]}},
+        {"op": "update", "id": first["id"], "data": {"name": "uno editado", "id": "ignorado", "seq": 99}},
+        {"op": "delete", "id": second["id"]},
+    )
+    body = response.get_json()
+    assert response.status_code == 200 and body["success"]
+    assert [result["op"] for result in body["results"]] == ["add", "update", "delete"]
+    assert body["results"][1]["id"] == first["id"]
+    assert names(client) == ["uno editado", "tres"]
+    assert client.get(f"/api/items/{first['id']}").get_json()["seq"] == first["seq"]
+
+
+def test_batch_with_missing_item_applies_nothing(client):
+    item = client.post("/api/items", json={"name": "uno"}).get_json()["item"]
+
+    response = batch(
+        client,
+        {"op": "update", "id": item["id"], "data": {"name": "cambiado"}},
+        {"op": "delete", "id": "no-existe"},
+    )
+    body = response.get_json()
+    assert response.status_code == 400 and not body["success"]
+    assert [result["valid"] for result in body["results"]] == [True, False]
+    assert body["results"][1]["error"] == "Item no encontrado"
+    assert names(client) == ["uno"]
+
+
+def test_batch_rejects_invalid_operations(client):
+    assert batch(client).status_code == 400
+    response = batch(client, {"op": "add", "data": {"name": "uno"}}, {"op": "rename"}, {"op": "update", "data": {}})
+    body = response.get_json()
+    assert response.status_code == 400
+    assert [result["valid"] for result in body["results"]] == [True, False, False]
+    assert names(client) == []
+
+
+def test_batch_requires_login():
+    assert app.app.test_client().post("/api/items/batch", json={"operations": []}).status_code == 401
@@ -0,0 +1,95 @@
+import io
+import struct
+import time
+
+import pytest
+
+import app
+
+EM = app.EncryptionManager
+HEADER = EM.CONTAINER_HEADER
+
+
+def seal(data, level=3, password="clave"):
+    out = io.BytesIO()
+    EM.write_container(io.BytesIO(data), out, password, level, len(data))
+    return out.getvalue()
+
+
+def unseal(data, password="clave"):
+    out = io.BytesIO()
+    level = EM.read_container(io.BytesIO(data), out, password)
+    return out.getvalue(), level
+
+
+def patch_header(data, **fields):
+    names = ("magic", "version", "level", "kdf", "iterations", "salt", "payload_length")
+    values = dict(zip(names, HEADER.unpack(data[:HEADER.size])))
+    values.update(fields)
+    return HEADER.pack(*(values[name] for name in names)) + data[HEADER.size:]
+
+
+@pytest.mark.parametrize("level", [1, 2, 3, 4, 5])
+def test_round_trip_levels(level):
+    data = b'{"items": []}' * 50
+    sealed = seal(data, level)
+    assert sealed.startswith(EM.CONTAINER_MAGIC)
+    magic, version, header_level, kdf, iterations, salt, payload_length = HEADER.unpack(sealed[:HEADER.size])
+    assert (version, header_level, payload_length) == (EM.CONTAINER_VERSION, level, len(data))
+    assert iterations == EM.KDF_ITERATIONS.get(level, 0)
+    assert unseal(sealed) == (data, level)
+
+
+def test_round_trip_empty_payload():
+    assert unseal(seal(b"")) == (b"", 3)
+
+
+def test_wrong_password_is_rejected():
+    with pytest.raises(ValueError):
+        unseal(seal(b"secreto"), password="otra")
+
+
+@pytest.mark.parametrize("fields", [
+    {"magic": b"\x89SVY"},
+    {"version": 2},
+    {"level": 0},
+    {"kdf": 7},
+    {"kdf": EM.KDF_SHA256, "iterations": 0},
+])
+def test_invalid_header_is_rejected(fields):
+    with pytest.raises(ValueError):
+        unseal(patch_header(seal(b"secreto", level=4), **fields))
+
+
+def test_forged_iteration_count_is_rejected_without_deriving():
+    forged = patch_header(seal(b"secreto", level=4), iterations=2 ** 32 - 1)
+    start = time.monotonic()
+    with pytest.raises(ValueError):
+        unseal(forged)
+    assert time.monotonic() - start < 1
+
+
+def test_tampered_salt_is_rejected():
+    sealed = seal(b"secreto")
+    salt = HEADER.unpack(sealed[:HEADER.size])[5]
+    with pytest.raises(ValueError):
+        unseal(patch_header(sealed, salt=bytes(b ^ 0xFF for b in salt)))
+
+
+def test_tampered_body_is_rejected():
+    sealed = bytearray(seal(b"secreto" * 30))
+    sealed[-5] ^= 0x01
+    with pytest.raises(ValueError):
+        unseal(bytes(sealed))
+
+
+@pytest.mark.parametrize("length", [0, 4, HEADER.size - 1, HEADER.size, HEADER.size + EM.STREAM_HEADER.size + 2])
+def test_truncated_container_is_rejected(length):
+    with pytest.raises(ValueError):
+        unseal(seal(b"secreto" * 30)[:length])
+
+
+def test_trailing_data_is_rejected():
+    sealed = seal(b"secreto" * 30)
+    with pytest.raises(ValueError):
+        unseal(sealed + struct.pack(">I", 0))
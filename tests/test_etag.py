@@ -0,0 +1,40 @@
+import pytest
+
+
+def conditional(client, url, etag, **params):
+    return client.get(url, query_string=params, headers={"If-None-Match": etag})
+
+
+@pytest.mark.parametrize("url", ["/api/items", "/api/stats", "/api/categories", "/api/items/count"])
+def test_unchanged_resource_answers_304(client, url):
+    client.post("/api/items", json={"name": "uno", "category": "casa"})
+    first = client.get(url)
+    etag = first.headers["ETag"].strip('"')
+    assert first.status_code == 200 and first.headers["Cache-Control"] == "private, no-cache"
+
+    again = conditional(client, url, etag)
+    assert again.status_code == 304 and again.data == b""
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+    client.post("/api/items", json={"name": "dos"})
+    assert conditional(client, url, etag).status_code == 200
+
+
+def test_list_etag_depends_on_query(client):
+    client.post("/api/items", json={"name": "uno"})
+    etag = client.get("/api/items", query_string={"limit": 1}).headers["ETag"].strip('"')
+    assert conditional(client, "/api/items", etag, limit=1).status_code == 304
+    assert conditional(client, "/api/items", etag, limit=2).status_code == 200
+
+
+def test_item_etag_follows_its_content(client):
+    item = client.post("/api/items", json={"name": "uno"}).get_json()["item"]
+    other = client.post("/api/items", json={"name": "otro"}).get_json()["item"]
+    url = f"/api/items/{item['id']}"
+    etag = client.get(url).headers["ETag"].strip('"')
+    assert conditional(client, url, etag).status_code == 304
+
+    client.put(f"/api/items/{other['id']}", json={"name": "otro editado"})
+    assert conditional(client, url, etag).status_code == 304
+    client.put(url, json={"name": "uno editado"})
+    assert conditional(client, url, etag).status_code == 200
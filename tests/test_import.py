@@ -0,0 +1,99 @@
+import base64
+import io
+import json
+
+import pytest
+
+import app
+
+
+def file_item(data):
+    return {"name": "adjunto", "type": "file", "content": base64.b64encode(data).decode()}
+
+
+def failing(items):
+    yield from items
+    raise ValueError("lectura interrumpida")
+
+
+@pytest.mark.parametrize("mode", ["replace", "merge"])
+def test_failed_import_drops_its_blobs(tmp_path, mode):
+    vault = app.Vault(str(tmp_path))
+    kept = vault.items.add(vault.externalize_item(app.new_item(file_item(b"existente"))))
+    with app.app.app_context(), pytest.raises(ValueError):
+        app.import_items_response(vault, failing([file_item(b"importado")]), mode)
+
+    assert [item["id"] for item in vault.items.all()] == [kept["id"]]
+    assert vault.blobs.exists(kept["blob"])
+    assert sorted(path.name for path in (tmp_path / "blobs").rglob("*") if path.is_file()) == [kept["blob"]]
+    vault.close()
+
+
+def test_load_sweeps_unreferenced_blobs(tmp_path):
+    vault = app.Vault(str(tmp_path))
+    kept = vault.items.add(vault.externalize_item(app.new_item(file_item(b"existente"))))
+    stray = vault.blobs.put(b"sin referencia")
+    vault.close()
+
+    reopened = app.Vault(str(tmp_path))
+    assert reopened.blobs.exists(kept["blob"])
+    assert not reopened.blobs.exists(stray)
+    reopened.close()
+
+
+def read_items(data, chunk_size):
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    return list(app.JsonItemReader(chunks).items())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64 * 1024])
+def test_reader_streams_items_across_chunk_boundaries(chunk_size):
+    items = [{"id": str(n), "name": "ñandú \"citado\"", "tags": ["a", "b"], "nested": {"x": [1, 2.5, None]}} for n in range(5)]
+    data = ("\ufeff" + json.dumps({"version": 1, "items": items, "exported": "hoy"}, ensure_ascii=False, indent=2)).encode()
+    assert read_items(data, chunk_size) == items
+
+
+@pytest.mark.parametrize("data", [b'{"items": [{"id": "1"}', b'{"items": [{"id": "1"},]}', b'[{"id": "1"}]'])
+def test_reader_rejects_malformed_documents(data):
+    with pytest.raises(ValueError):
+        read_items(data, 4)
+
+
+def post_import(client, document, mode):
+    data = json.dumps(document).encode()
+    return client.post("/api/import", data={"mode": mode, "file": (io.BytesIO(data), "export.json")})
+
+
+def listed(client):
+    return {item["id"]: item["name"] for item in client.get("/api/items").get_json()}
+
+
+def test_import_merge_upserts_by_id(client):
+    kept = client.post("/api/items", json={"name": "se queda"}).get_json()["item"]
+    changed = client.post("/api/items", json={"name": "antes"}).get_json()["item"]
+    same = client.get(f"/api/items/{kept['id']}").get_json()
+
+    response = post_import(client, {"items": [same, dict(changed, name="después"), {"name": "nuevo"}, "no es un item"]}, "merge")
+    body = response.get_json()
+    assert response.status_code == 200 and body["success"]
+    assert (body["inserted"], body["updated"], body["skipped"]) == (1, 1, 2)
+    items = listed(client)
+    assert items[kept["id"]] == "se queda" and items[changed["id"]] == "después"
+    assert sorted(items.values()) == ["después", "nuevo", "se queda"]
+
+
+def test_import_replace_discards_previous_items(client):
+    client.post("/api/items", json={"name": "viejo"})
+
+    response = post_import(client, {"items": [{"id": "a", "name": "uno"}, {"id": "b", "name": "dos"}]}, "replace")
+    assert response.get_json()["inserted"] == 2
+    assert listed(client) == {"a": "uno", "b": "dos"}
+    assert [item["seq"] for item in client.get("/api/items").get_json()] == [1, 2]
+
+
+def test_import_rejects_bad_requests(client):
+    client.post("/api/items", json={"name": "intacto"})
+    assert post_import(client, {"items": []}, "sobrescribir").status_code == 400
+    response = client.post("/api/import", data={"mode": "replace", "file": (io.BytesIO(b'{"items": [{"id": "x"'), "export.json")})
+    assert response.status_code == 400
+    assert list(listed(client).values()) == ["intacto"]
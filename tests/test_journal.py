@@ -0,0 +1,144 @@
+import os
+
+import app
+
+
+def open_store(tmp_path):
+    return app.JournaledItemStore(str(tmp_path / "items.json"), str(tmp_path / "items.journal"))
+
+
+def populate(store):
+    first = store.add(app.new_item({"name": "primero", "tags": ["a"]}))
+    second = store.add(app.new_item({"name": "segundo"}))
+    third = store.add(app.new_item({"name": "tercero"}))
+    store.update(first["id"], {"name": "primero editado"})
+    store.delete(second["id"])
+    return first, third
+
+
+def snapshot(store):
+    return [dict(item) for item in store.all()], store.current_revision()
+
+
+def test_reopen_replays_journal(tmp_path):
+    store = open_store(tmp_path)
+    populate(store)
+    expected = snapshot(store)
+    store.close()
+
+    reopened = open_store(tmp_path)
+    assert snapshot(reopened) == expected
+    assert [item["name"] for item in reopened.all()] == ["primero editado", "tercero"]
+    reopened.close()
+
+
+def test_torn_tail_is_ignored_and_trimmed(tmp_path):
+    store = open_store(tmp_path)
+    populate(store)
+    expected = snapshot(store)
+    store.close()
+    journal = tmp_path / "items.journal"
+    size = journal.stat().st_size
+    with open(journal, "ab") as f:
+        f.write(b'{"op":"put","id":"x","rev":99,"item":{"id":"x"')
+
+    reopened = open_store(tmp_path)
+    assert snapshot(reopened) == expected
+    assert journal.stat().st_size == size
+    reopened.close()
+
+
+def test_replay_stops_at_unreadable_record(tmp_path):
+    store = open_store(tmp_path)
+    populate(store)
+    expected = snapshot(store)
+    store.close()
+    with open(tmp_path / "items.journal", "ab") as f:
+        f.write(b"not json\n")
+        f.write(b'{"op":"delete","id":"whatever","rev":100}\n')
+
+    reopened = open_store(tmp_path)
+    assert snapshot(reopened) == expected
+    reopened.close()
+
+
+def test_compaction_keeps_items(tmp_path):
+    store = open_store(tmp_path)
+    populate(store)
+    expected = snapshot(store)
+    store.compact()
+    assert os.path.getsize(tmp_path / "items.journal") == 0
+    assert not os.path.exists(tmp_path / "items.journal.old")
+    store.close()
+
+    reopened = open_store(tmp_path)
+    assert snapshot(reopened) == expected
+    reopened.close()
+
+
+def test_leftover_old_journal_is_replayed(tmp_path):
+    store = open_store(tmp_path)
+    populate(store)
+    expected = snapshot(store)
+    store.close()
+    os.replace(tmp_path / "items.journal", tmp_path / "items.journal.old")
+
+    reopened = open_store(tmp_path)
+    assert snapshot(reopened) == expected
+    reopened.close()
+
+
+def test_fold_writes_journal_into_snapshot(tmp_path):
+    store = open_store(tmp_path)
+    populate(store)
+    expected = snapshot(store)
+    store.close()
+
+    app.JournaledItemStore.fold(str(tmp_path / "items.json"), str(tmp_path / "items.journal"))
+    assert not os.path.exists(tmp_path / "items.journal")
+    plain = app.ItemStore(str(tmp_path / "items.json"))
+    assert snapshot(plain) == expected
+    plain.close()
+
+
+def test_other_instance_sees_appended_records(tmp_path):
+    writer = open_store(tmp_path)
+    reader = open_store(tmp_path)
+    first, third = populate(writer)
+    added = writer.add(app.new_item({"name": "cuarto"}))
+
+    assert reader.get(added["id"]) == added
+    assert reader.get(first["id"])["name"] == "primero editado"
+    assert snapshot(reader) == snapshot(writer)
+    assert [event["op"] for event in reader.events_since(0)][-1] == "add"
+    writer.close()
+    reader.close()
+
+
+def test_stale_journal_after_snapshot_is_skipped(tmp_path):
+    store = open_store(tmp_path)
+    populate(store)
+    stale = (tmp_path / "items.journal").read_bytes()
+    store.replace_all([app.new_item({"name": "reemplazo"})])
+    expected = snapshot(store)
+    store.close()
+    (tmp_path / "items.journal").write_bytes(stale)
+
+    reopened = open_store(tmp_path)
+    assert snapshot(reopened) == expected
+    assert [item["name"] for item in reopened.all()] == ["reemplazo"]
+    reopened.close()
+
+
+def test_replace_from_stale_instance_advances_revision(tmp_path):
+    writer = open_store(tmp_path)
+    stale = open_store(tmp_path)
+    populate(writer)
+    revision = writer.current_revision()
+
+    stale.replace_all([app.new_item({"name": "reemplazo"})])
+    assert stale.current_revision() > revision
+    assert writer.current_revision() == stale.current_revision()
+    assert [item["name"] for item in writer.all()] == ["reemplazo"]
+    writer.close()
+    stale.close()
@@ -0,0 +1,106 @@
+import sqlite3
+
+import pytest
+
+import app
+
+
+def open_store(kind, tmp_path):
+    if kind == "sqlite":
+        return app.SqliteItemStore(str(tmp_path / "items.db"))
+    if kind == "journal":
+        return app.JournaledItemStore(str(tmp_path / "items.json"), str(tmp_path / "items.journal"))
+    return app.ItemStore(str(tmp_path / "items.json"))
+
+
+def walk(paginate):
+    pages, cursor = [], ""
+    while True:
+        page, cursor, total = paginate(cursor)
+        pages.append(([item["id"] for item in page], total))
+        if not cursor:
+            return pages
+
+
+@pytest.mark.parametrize("kind", ["json", "journal", "sqlite"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_store_pages_match_in_memory_pages(tmp_path, kind, order):
+    store = open_store(kind, tmp_path)
+    items = [store.add(app.new_item({"name": f"item {n}"})) for n in range(12)]
+    for item in items[2:9:3]:
+        store.delete(item["id"])
+
+    fast = walk(lambda cursor: app.paginate_store(store, order, 4, cursor))
+    slow = walk(lambda cursor: app.paginate_items(store.query(), "", order, 4, cursor))
+    assert fast == slow
+    assert sum(len(ids) for ids, _ in fast) == 9
+    store.close()
+
+
+def test_sorted_cursor_is_rejected(tmp_path):
+    store = open_store("sqlite", tmp_path)
+    store.add(app.new_item({"name": "uno"}))
+    with pytest.raises(ValueError):
+        app.paginate_store(store, "asc", 4, app.encode_cursor({"key": ["uno", "x"]}))
+    store.close()
+
+
+def test_sqlite_drops_unused_column_indexes(tmp_path):
+    conn = sqlite3.connect(tmp_path / "items.db")
+    conn.execute("CREATE TABLE items (seq INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, category TEXT, type TEXT, "
+                 "encrypted INTEGER NOT NULL DEFAULT 0, level INTEGER NOT NULL DEFAULT 0, created TEXT, modified TEXT, data TEXT NOT NULL)")
+    conn.execute("CREATE INDEX idx_items_category ON items(category)")
+    conn.commit()
+    conn.close()
+
+    store = open_store("sqlite", tmp_path)
+    names = [row[0] for row in store.connect().execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")]
+    assert names == []
+    store.close()
+
+
+def get_page(client, **params):
+    response = client.get("/api/items", query_string=params)
+    assert response.status_code == 200
+    return response.get_json(), response.headers.get("X-Next-Cursor"), int(response.headers["X-Total-Count"])
+
+
+def add_items(client, count, **fields):
+    return [client.post("/api/items", json={"name": f"item {n:02}", **fields}).get_json()["item"] for n in range(count)]
+
+
+@pytest.mark.parametrize("params", [{}, {"category": "trabajo"}, {"search": "item"}])
+def test_cursor_survives_deletes_between_pages(client, params):
+    items = add_items(client, 10, category="trabajo")
+    page, cursor, total = get_page(client, limit=4, **params)
+    assert [item["id"] for item in page] == [item["id"] for item in items[:4]] and total == 10
+
+    client.delete(f"/api/items/{items[3]['id']}")
+    client.delete(f"/api/items/{items[4]['id']}")
+    page, cursor, total = get_page(client, limit=4, cursor=cursor, **params)
+    assert [item["id"] for item in page] == [item["id"] for item in items[5:9]] and total == 8
+    page, cursor, _ = get_page(client, limit=4, cursor=cursor, **params)
+    assert [item["id"] for item in page] == [items[9]["id"]] and cursor is None
+
+
+def test_descending_pages_by_sort_field(client):
+    add_items(client, 5)
+    seen, cursor = [], ""
+    while True:
+        page, cursor, _ = get_page(client, limit=2, sort="name", order="desc", cursor=cursor)
+        seen.extend(item["name"] for item in page)
+        if not cursor:
+            break
+    assert seen == [f"item {n:02}" for n in range(4, -1, -1)]
+
+
+def test_fields_project_items(client):
+    add_items(client, 1, content="contenido largo")
+    page, _, _ = get_page(client, fields="name,preview,missing")
+    assert page == [{"id": page[0]["id"], "name": "item 00", "preview": "contenido largo"}]
+
+
+@pytest.mark.parametrize("params", [{"limit": -1}, {"limit": "x"}, {"sort": "password"}, {"order": "up"}, {"cursor": "no-es-un-cursor"}])
+def test_invalid_pagination_is_rejected(client, params):
+    add_items(client, 1)
+    assert client.get("/api/items", query_string=dict(params, limit=params.get("limit", 2))).status_code == 400
@@ -0,0 +1,57 @@
+import threading
+
+import app
+
+
+def test_idle_vaults_are_evicted_and_closed(tmp_path):
+    registry = app.VaultRegistry(str(tmp_path), max_vaults=1, idle_seconds=600)
+    first = registry.acquire("ana")
+    second = registry.acquire("beto")
+    assert list(registry.vaults) == ["ana", "beto"]
+
+    registry.release(first)
+    assert list(registry.vaults) == ["beto"]
+    registry.release(second)
+    assert registry.acquire("beto") is second
+    registry.release(second)
+
+
+def test_vault_in_use_is_not_evicted(tmp_path):
+    registry = app.VaultRegistry(str(tmp_path), max_vaults=1, idle_seconds=0)
+    vault = registry.acquire("ana")
+    assert registry.acquire("ana") is vault
+    registry.release(vault)
+    assert "ana" in registry.vaults
+    registry.release(vault)
+    assert "ana" not in registry.vaults
+
+
+def test_slow_load_only_blocks_its_own_user(tmp_path):
+    registry = app.VaultRegistry(str(tmp_path))
+    started = threading.Event()
+    proceed = threading.Event()
+    load = registry.load
+
+    def slow_load(username):
+        if username == "lento":
+            started.set()
+            proceed.wait(5)
+        return load(username)
+
+    registry.load = slow_load
+    results = []
+    waiters = [threading.Thread(target=lambda: results.append(registry.acquire("lento"))) for _ in range(3)]
+    for thread in waiters:
+        thread.start()
+    assert started.wait(5)
+
+    other = registry.acquire("rapido")
+    assert not proceed.is_set()
+    proceed.set()
+    for thread in waiters:
+        thread.join(5)
+
+    assert len(results) == 3 and all(vault is results[0] for vault in results)
+    assert results[0].users == 3
+    for vault in results + [other]:
+        registry.release(vault)
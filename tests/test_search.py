@@ -0,0 +1,82 @@
+import pytest
+
+
+@pytest.fixture
+def vault(client):
+    for name, tags, category in [
+        ("Banco Santander", ["finanzas"], "personal"),
+        ("Correo trabajo", ["email", "finanzas"], "trabajo"),
+        ("Contraseña wifi", ["casa"], "personal"),
+    ]:
+        client.post("/api/items", json={"name": name, "tags": tags, "category": category})
+    return client
+
+
+def suggest(client, query, **params):
+    response = client.get("/api/items/suggest", query_string={"q": query, **params})
+    assert response.status_code == 200
+    return [(entry["text"], entry["distance"]) for entry in response.get_json()]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("banco", ("Banco Santander", 0)),
+    ("bnaco", ("Banco Santander", 1)),
+    ("crreo", ("Correo trabajo", 1)),
+    ("contrasena", ("Contraseña wifi", 1)),
+])
+def test_suggest_tolerates_one_typo(vault, query, expected):
+    assert suggest(vault, query)[0] == expected
+
+
+def test_suggest_ranks_exact_prefix_first_and_limits(vault):
+    assert suggest(vault, "cor")[0] == ("Correo trabajo", 0)
+    assert len(suggest(vault, "cor", limit=1)) == 1
+    assert suggest(vault, "fin") == [("finanzas", 0)]
+    assert suggest(vault, "bxnxo") == []
+
+
+def test_suggest_follows_renames(vault):
+    item = next(item for item in vault.get("/api/items").get_json() if item["name"] == "Banco Santander")
+    vault.put(f"/api/items/{item['id']}", json={"name": "Hipoteca"})
+    assert suggest(vault, "banco") == []
+    assert suggest(vault, "hipo") == [("Hipoteca", 0)]
+
+
+def test_suggest_rejects_bad_limit(vault):
+    assert vault.get("/api/items/suggest", query_string={"q": "ban", "limit": 0}).status_code == 400
+
+
+def filtered(client, **params):
+    response = client.get("/api/items", query_string=params)
+    assert response.status_code == 200
+    return sorted(item["name"] for item in response.get_json())
+
+
+def test_tags_match_all_by_default(vault):
+    assert filtered(vault, tags="finanzas") == ["Banco Santander", "Correo trabajo"]
+    assert filtered(vault, tags="finanzas, email") == ["Correo trabajo"]
+    assert filtered(vault, tags="finanzas,email", tags_mode="and") == ["Correo trabajo"]
+    assert filtered(vault, tags="finanzas,desconocida") == []
+
+
+def test_tags_or_mode_matches_any(vault):
+    assert filtered(vault, tags="email,casa", tags_mode="or") == ["Contraseña wifi", "Correo trabajo"]
+    assert filtered(vault, tags="casa,desconocida", tags_mode="or") == ["Contraseña wifi"]
+
+
+def test_tags_combine_with_other_filters(vault):
+    assert filtered(vault, tags="finanzas", category="personal") == ["Banco Santander"]
+    assert filtered(vault, tags="finanzas", search="correo") == ["Correo trabajo"]
+    count = vault.get("/api/items/count", query_string={"tags": "finanzas,casa", "tags_mode": "or"}).get_json()
+    assert count == {"count": 3}
+
+
+def test_tag_index_follows_updates(vault):
+    item = next(item for item in vault.get("/api/items").get_json() if item["name"] == "Contraseña wifi")
+    vault.put(f"/api/items/{item['id']}", json={"tags": ["finanzas"]})
+    assert filtered(vault, tags="casa") == []
+    assert filtered(vault, tags="finanzas") == ["Banco Santander", "Contraseña wifi", "Correo trabajo"]
+
+
+def test_unknown_tags_mode_is_rejected(vault):
+    assert vault.get("/api/items", query_string={"tags": "casa", "tags_mode": "xor"}).status_code == 400
@@ -0,0 +1,113 @@
+import json
+import os
+
+import pytest
+
+import app
+
+ITEMS = [
+    {"id": "a1", "name": "Cuenta del banco", "type": "password", "content": "ñandú " * 200, "tags": ["x"], "seq": 1},
+    {"id": "b2", "name": "Nota", "type": "note", "content": "", "tags": [], "seq": 2},
+]
+CODECS = ["none", "zlib"] + (["zstd"] if app.zstandard is not None else [])
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    def configure(storage_format="compact", compression="zlib"):
+        monkeypatch.setattr(app, "STORAGE_FORMAT", storage_format)
+        monkeypatch.setattr(app, "STORAGE_COMPRESSION", compression)
+    return configure
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_round_trip_codecs(storage, codec):
+    storage(compression=codec)
+    data = app.encode_snapshot(ITEMS, 42)
+    assert data[:3] == app.SNAPSHOT_MAGIC
+    assert data[3:5] == bytes([app.SNAPSHOT_VERSION, app.SNAPSHOT_CODECS[codec]])
+    assert app.decode_snapshot(data) == (ITEMS, 42)
+
+
+def test_round_trip_plain_json(storage):
+    storage(storage_format="json")
+    data = app.encode_snapshot(ITEMS, 7)
+    assert json.loads(data) == {"revision": 7, "items": ITEMS}
+    assert app.decode_snapshot(data) == (ITEMS, 7)
+
+
+def test_compression_shrinks_repetitive_items(storage):
+    storage(compression="none")
+    plain = app.encode_snapshot(ITEMS)
+    storage(compression="zlib")
+    assert len(app.encode_snapshot(ITEMS)) < len(plain) / 4
+
+
+def test_legacy_documents():
+    assert app.decode_snapshot(json.dumps(ITEMS).encode()) == (ITEMS, 0)
+    assert app.decode_snapshot(json.dumps({"items": ITEMS}).encode()) == (ITEMS, 0)
+    version1 = app.SNAPSHOT_MAGIC + bytes([1, 0]) + json.dumps({"revision": 3, "items": ITEMS}).encode()
+    assert app.decode_snapshot(version1) == (ITEMS, 3)
+
+
+@pytest.mark.parametrize("data", [
+    b"SVS",
+    b"SVS\x02",
+    b"SVS\x09\x00{}",
+    b"SVS\x02\x07{}",
+    b"SVS\x02\x00",
+    b"SVS\x02\x00[1, 2",
+    b'{"revision": 1}',
+    b"42",
+])
+def test_malformed_snapshots_are_rejected(data):
+    with pytest.raises(ValueError):
+        app.decode_snapshot(data)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_truncated_snapshot_is_rejected(storage, codec):
+    storage(compression=codec)
+    data = app.encode_snapshot(ITEMS, 1)
+    for length in (5, 6, len(data) // 2, len(data) - 1):
+        with pytest.raises(ValueError):
+            app.decode_snapshot(data[:length])
+
+
+@pytest.mark.parametrize("codec", [codec for codec in CODECS if codec != "none"])
+def test_corrupted_compressed_payload_is_rejected(storage, codec):
+    storage(compression=codec)
+    data = bytearray(app.encode_snapshot(ITEMS, 1))
+    data[len(data) // 2] ^= 0xFF
+    with pytest.raises(ValueError):
+        app.decode_snapshot(bytes(data))
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_item_store_reopens_compressed_snapshot(storage, tmp_path, codec):
+    storage(compression=codec)
+    path = str(tmp_path / "items.json")
+    store = app.ItemStore(path)
+    added = [store.add(app.new_item({"name": f"item {i}", "content": "x" * i})) for i in range(5)]
+    store.update(added[0]["id"], {"name": "renombrado"})
+    store.close()
+
+    reopened = app.ItemStore(path)
+    assert reopened.all() == store.all()
+    assert reopened.current_revision() == store.current_revision() == 6
+    reopened.close()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_private_file_is_created_with_its_mode(tmp_path):
+    path = str(tmp_path / "secret.key")
+    with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+        f.write(b"restos")
+    umask = os.umask(0)
+    try:
+        app.write_file_atomic(path, b"clave", mode=0o600)
+    finally:
+        os.umask(umask)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert (tmp_path / "secret.key").read_bytes() == b"clave"
+    assert os.listdir(tmp_path) == ["secret.key"]
@@ -0,0 +1,108 @@
+import io
+import struct
+
+import pytest
+
+import app
+
+EM = app.EncryptionManager
+CHUNK = 64
+
+
+def encrypt(data, level=3, password="clave", chunk_size=CHUNK, master_key=None):
+    out = io.BytesIO()
+    EM.encrypt_stream(io.BytesIO(data), out, password, level, chunk_size, master_key)
+    return out.getvalue()
+
+
+def decrypt(data, password="clave", master_key=None):
+    out = io.BytesIO()
+    level = EM.decrypt_stream(io.BytesIO(data), out, password, master_key)
+    return out.getvalue(), level
+
+
+def frames(data):
+    offset = EM.STREAM_HEADER.size
+    result = []
+    while offset < len(data):
+        (length,) = struct.unpack(">I", data[offset:offset + 4])
+        result.append(data[offset:offset + 4 + length])
+        offset += 4 + length
+    return data[:EM.STREAM_HEADER.size], result
+
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 5 * CHUNK, 5 * CHUNK + 7])
+def test_round_trip_sizes(size):
+    data = bytes(range(256)) * (size // 256 + 1)
+    data = data[:size]
+    sealed = encrypt(data)
+    assert decrypt(sealed) == (data, 3)
+    assert len(sealed) == EM.stream_length(size, CHUNK)
+
+
+@pytest.mark.parametrize("level", [1, 2, 3, 4, 5])
+def test_round_trip_levels(level):
+    data = b"contenido secreto " * 20
+    assert decrypt(encrypt(data, level)) == (data, level)
+
+
+def test_round_trip_with_master_key():
+    key = b"k" * 32
+    data = b"x" * 300
+    sealed = encrypt(data, level=5, master_key=key)
+    assert decrypt(sealed, master_key=key) == (data, 5)
+    with pytest.raises(ValueError):
+        decrypt(sealed, master_key=b"j" * 32)
+
+
+def test_wrong_password_is_rejected():
+    with pytest.raises(ValueError):
+        decrypt(encrypt(b"hola mundo"), password="otra")
+
+
+@pytest.mark.parametrize("position", [EM.STREAM_HEADER.size + 4, EM.STREAM_HEADER.size + 30, -1])
+def test_tampered_ciphertext_is_rejected(position):
+    sealed = bytearray(encrypt(b"a" * 200))
+    sealed[position] ^= 0x01
+    with pytest.raises(ValueError):
+        decrypt(bytes(sealed))
+
+
+def test_tampered_header_is_rejected():
+    sealed = bytearray(encrypt(b"a" * 200))
+    # chunk_size sits right after the magic and level; it is authenticated as part of every frame.
+    sealed[5:9] = struct.pack(">I", CHUNK * 2)
+    with pytest.raises(ValueError):
+        decrypt(bytes(sealed))
+    sealed = bytearray(encrypt(b"a" * 200))
+    sealed[:4] = b"XXXX"
+    with pytest.raises(ValueError):
+        decrypt(bytes(sealed))
+
+
+def test_reordered_frames_are_rejected():
+    header, parts = frames(encrypt(b"abcdefgh" * 40))
+    assert len(parts) > 2
+    parts[0], parts[1] = parts[1], parts[0]
+    with pytest.raises(ValueError):
+        decrypt(header + b"".join(parts))
+
+
+def test_truncation_at_frame_boundary_is_rejected():
+    header, parts = frames(encrypt(b"abcdefgh" * 40))
+    for keep in range(len(parts)):
+        with pytest.raises(ValueError):
+            decrypt(header + b"".join(parts[:keep]))
+
+
+@pytest.mark.parametrize("cut", [1, 3, 17])
+def test_truncation_inside_frame_is_rejected(cut):
+    sealed = encrypt(b"abcdefgh" * 40)
+    with pytest.raises(ValueError):
+        decrypt(sealed[:-cut])
+
+
+def test_trailing_frame_after_final_is_rejected():
+    header, parts = frames(encrypt(b"abcdefgh" * 40))
+    with pytest.raises(ValueError):
+        decrypt(header + b"".join(parts) + parts[-1])